@@ -0,0 +1,146 @@
+from array import array
+from itertools import accumulate
+
+# Typecodes of unsigned integer arrays, smallest first, so the first one that fits a width is used.
+UNSIGNED_TYPECODES: list[str] = ["B", "H", "I", "L", "Q"]
+
+
+def int_typecode(width: int | str) -> str:
+    """The array typecode holding unsigned integers of the given width (the widest, if derived)."""
+
+    if isinstance(width, str):
+        width = 8
+
+    for typecode in UNSIGNED_TYPECODES:
+        if array(typecode).itemsize == width:
+            return typecode
+
+    raise ValueError(f"No array typecode holds {width} byte integers.")
+
+
+class BinaryColumn:
+    """
+    A column of variable-length bytes or str values, Arrow style: all values back to back in one
+    data buffer, with value i spanning data[offsets[i]:offsets[i + 1]]. Strings are kept encoded, and
+    only decoded when a value is looked up.
+    """
+
+    def __init__(self, encoding: str | None = None):
+        self.encoding = encoding
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+
+    def append(self, raw: bytes):
+        self.data += raw
+        self.offsets.append(len(self.data))
+
+    def extend(self, raws):
+        raws = list(raws)
+        start: int = len(self.data)
+
+        self.data += b"".join(raws)
+
+        # accumulate() starts with the current end offset, which is already there.
+        ends = accumulate((len(raw) for raw in raws), initial=start)
+        next(ends)
+        self.offsets.extend(ends)
+
+    def raw(self, index: int) -> bytes:
+        return bytes(self.data[self.offsets[index] : self.offsets[index + 1]])
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("BinaryColumn index out of range")
+
+        value = self.raw(index)
+        return value.decode(self.encoding) if self.encoding is not None else value
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self) -> str:
+        return f"BinaryColumn({len(self)} values, {len(self.data)} bytes)"
+
+
+class ListColumn:
+    """
+    A column of arrays: the elements of every array are stored back to back in one child column,
+    with array i spanning values[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.offsets = array("Q", [0])
+
+    def __getitem__(self, index: int) -> list:
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("ListColumn index out of range")
+
+        return [
+            column_value(self.values, i)
+            for i in range(self.offsets[index], self.offsets[index + 1])
+        ]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self) -> str:
+        return f"ListColumn({len(self)} arrays, {self.offsets[-1]} elements)"
+
+
+def column_value(column, index: int):
+    """Looks up one value of any column, rebuilding the dictionary for nested structure columns."""
+
+    if isinstance(column, dict):
+        return {name: column_value(child, index) for name, child in column.items()}
+
+    return column[index]
+
+
+def to_numpy(columns):
+    """
+    Converts a column set (or a single column) to NumPy arrays, without copying the numeric data.
+    Binary columns become a (data, offsets) pair of uint8 and uint64 arrays, list columns an
+    (offsets, values) pair, and switch columns an object array. Requires NumPy.
+    """
+
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("to_numpy() requires NumPy, which is not installed.")
+
+    if isinstance(columns, dict):
+        return {name: to_numpy(column) for name, column in columns.items()}
+
+    if isinstance(columns, array):
+        return numpy.frombuffer(columns, dtype=columns.typecode)
+
+    if isinstance(columns, BinaryColumn):
+        return (
+            numpy.frombuffer(columns.data, dtype=numpy.uint8),
+            numpy.frombuffer(columns.offsets, dtype=numpy.uint64),
+        )
+
+    if isinstance(columns, ListColumn):
+        return (
+            numpy.frombuffer(columns.offsets, dtype=numpy.uint64),
+            to_numpy(columns.values),
+        )
+
+    column = numpy.empty(len(columns), dtype=object)
+    column[:] = columns
+    return column
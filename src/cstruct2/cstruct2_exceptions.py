@@ -13,8 +13,9 @@ class cstruct2_invalid_value_exception(Exception):
     def __init__(self, value_type: str, allowed_types: list[str]):
         super().__init__(
             (
-                f"Value {value_type} passed in when only types"
-                " ".join(allowed_types) + "are allowed."
+                f"Value of type {value_type} passed in when only types "
+                + ", ".join(allowed_types)
+                + " are allowed."
             )
         )
 
@@ -98,3 +99,46 @@ class cstruct2_switch_dependent_wrong(Exception):
                 f" but {victim} either comes after {offender} or doesn't exist at all!"
             )
         )
+
+
+class cstruct2_checksum_exception(Exception):
+    """This is raised when a checksum field does not match the bytes it covers."""
+
+    def __init__(self, name: str, expected: int, computed: int):
+        super().__init__(
+            f"The checksum {name} says {expected:#010x}, but the bytes it covers add up to {computed:#010x}."
+        )
+
+
+class cstruct2_unknown_message_exception(Exception):
+    """This is raised when a protocol is asked to encode a message type it has no body for."""
+
+    def __init__(self, message_type):
+        super().__init__(f"The message type {message_type!r} has no body structure.")
+
+
+class cstruct2_message_length_exception(Exception):
+    """This is raised when a message header gives a length shorter than the header itself."""
+
+    def __init__(self, length_field: str, length: int, header_size: int):
+        super().__init__(
+            f"The message length in '{length_field}' is {length}, but the header alone takes "
+            f"{header_size} bytes. Is the stream corrupt?"
+        )
+
+
+class cstruct2_missing_value_exception(Exception):
+    """This is raised when the values to write leave out a field that has to be written."""
+
+    def __init__(self, field_name: str):
+        super().__init__(f"No value was given for the field '{field_name}'.")
+
+
+class cstruct2_memory_ordering_exception(Exception):
+    """This is raised when a lock-free shared memory ring is used on a machine that may reorder stores."""
+
+    def __init__(self, machine: str):
+        super().__init__(
+            f"Without a lock, shared memory rings rely on x86 store ordering, which {machine!r} "
+            "does not guarantee. Pass the same multiprocessing lock to the producer and every consumer."
+        )
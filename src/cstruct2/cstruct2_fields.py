@@ -9,6 +9,31 @@ class switch_type:
 switch = switch_type
 
 
+class checksum_type:
+    def __init__(
+        self,
+        algorithm: str = "crc32",
+        start: str | None = None,
+        end: str | None = None,
+        endianness: str = "little",
+        name: str = None,
+    ):
+        self.name = name
+        self.algorithm = algorithm
+
+        # The checksum covers the fields from start to end, inclusive. By default, that's
+        # every field before the checksum.
+        self.start = start
+        self.end = end
+
+        self.width = 4
+        self.endianness = endianness
+        self.wrapper = None
+
+
+checksum = checksum_type
+
+
 class cstruct2_number_field:
     def __init__(self, name: str, width: int, kind: str, endianness):
 
@@ -17,6 +42,7 @@ class cstruct2_number_field:
         self.width = width
         self.endianness = endianness
         self.wrapper = None
+        self.endianness_str: str = ">" if endianness == "big" else "<"
 
 
 class cstruct2_int_field(cstruct2_number_field):
@@ -40,6 +66,9 @@ class cstruct2_bytes_field:
         self.width = width
         self.wrapper = None
 
+        # Set through Structure.set_lazy().
+        self.lazy: bool = False
+
 
 class cstruct2_bits_field:
     def __init__(self, name: str, width: int | str):
@@ -58,6 +87,11 @@ class cstruct2_string_field:
         self.wrapper = None
         self.encoding: str = "ascii"
 
+        # Optional decoding behaviour, set through Structure.set_interning().
+        self.intern_table = None
+        self.strip_padding: bool = False
+        self.lazy: bool = False
+
 
 class cstruct2_recursive_wrapper:
     def __init__(self, name: str, another_cstruct):
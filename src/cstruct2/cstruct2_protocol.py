@@ -0,0 +1,132 @@
+import os
+
+from collections import Counter
+from io import BytesIO
+
+from .cstruct2_exceptions import *
+from .cstruct2_fields import checksum_type
+from .decorator import Structure
+
+
+class Protocol:
+    """
+    A multi-message protocol: every message is a header structure, carrying the message type and the
+    length of the body, followed by a body whose structure depends on the type. The body structure
+    is looked up in a table built once, so dozens of message types cost one dictionary lookup, and
+    bodies of unknown types are skipped over using the length alone.
+    """
+
+    def __init__(
+        self,
+        header: Structure,
+        bodies: dict,
+        type_field: str = "type",
+        length_field: str = "length",
+        length_includes_header: bool = False,
+    ):
+        for name in [type_field, length_field]:
+            if name not in header.field_correspondence:
+                raise cstruct2_non_existent_field_exception(name)
+
+        self.header = header
+        self.type_field = type_field
+        self.length_field = length_field
+
+        # The length has to be adjusted by the header's size if it counts the header too, which
+        # is only known up front for fixed size headers.
+        self.header_size: int = len(header) if length_includes_header else 0
+
+        self.bodies: dict = dict(bodies)
+
+        # Per message type counts of what went through this protocol.
+        self.decoded = Counter()
+        self.encoded = Counter()
+        self.skipped = Counter()
+
+    def __skip(self, stream, length: int):
+        seekable = getattr(stream, "seekable", None)
+
+        if seekable is not None and seekable():
+            stream.seek(length, os.SEEK_CUR)
+            return
+
+        while length > 0:
+            data: bytes = stream.read(min(length, 65536))
+            if not data:
+                raise cstruct2_overflow_exception(self.length_field)
+
+            length -= len(data)
+
+    def decode(self, stream) -> tuple:
+        """
+        Reads one message from a stream, returning its type, its header and its body. Bodies of types
+        that have no structure are skipped, and returned as None. A body never reads past the length
+        its header gives it.
+        """
+
+        header: dict = self.header.from_stream(stream)
+        message_type = header[self.type_field]
+        length: int = header[self.length_field] - self.header_size
+
+        # A corrupt length would otherwise seek backwards, or read the rest of the stream.
+        if length < 0:
+            raise cstruct2_message_length_exception(
+                self.length_field, header[self.length_field], self.header_size
+            )
+
+        body_structure: Structure | None = self.bodies.get(message_type)
+
+        if body_structure is None:
+            self.__skip(stream, length)
+            self.skipped[message_type] += 1
+            return message_type, header, None
+
+        data: bytes = stream.read(length)
+        if len(data) != length:
+            raise cstruct2_overflow_exception(self.length_field)
+
+        body: dict = body_structure.from_bytes(data)
+        self.decoded[message_type] += 1
+
+        return message_type, header, body
+
+    def decode_bytes(self, data: bytes) -> tuple:
+        """Reads one message from a bytes object."""
+
+        return self.decode(BytesIO(data))
+
+    def encode(
+        self, message_type, body: dict, header: dict | None = None, stream=None
+    ) -> bytes:
+        """
+        Encodes a message of a given type. The header's type and length fields are filled in, and every
+        other header field has to be given in header. The message is written to stream, if given, and returned.
+        """
+
+        body_structure: Structure | None = self.bodies.get(message_type)
+        if body_structure is None:
+            raise cstruct2_unknown_message_exception(message_type)
+
+        body_data: bytes = body_structure.to_bytes(body)
+
+        header = dict(header or {})
+
+        # to_bytes() skips fields it has no value for, which would shift the rest of the header.
+        # Checksums are the exception: missing ones are computed.
+        for name in self.header.field_names:
+            if name in [self.type_field, self.length_field] or name in header:
+                continue
+
+            if not isinstance(self.header.field_correspondence[name], checksum_type):
+                raise cstruct2_missing_value_exception(name)
+
+        header[self.type_field] = message_type
+        header[self.length_field] = len(body_data) + self.header_size
+
+        data: bytes = self.header.to_bytes(header) + body_data
+        self.encoded[message_type] += 1
+
+        if stream is not None:
+            stream.write(data)
+
+        return data
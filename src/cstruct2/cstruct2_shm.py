@@ -0,0 +1,371 @@
+import platform
+import struct
+import time
+
+from multiprocessing import shared_memory
+
+from .cstruct2_exceptions import *
+from .decorator import Structure
+
+# Layout of the shared memory block:
+#
+#   header     magic, capacity, consumer count, closed flag, published sequence and byte position
+#   cursors    one cache line per consumer: its read sequence and byte position
+#   data       the ring itself, holding frames of [length: u32, pad: u32, sequence: u64, record]
+#
+# Byte positions only ever grow; position % capacity is where they are in the ring. Frames are aligned
+# to 8 bytes, so the 64 bit counters are written with single aligned stores. Only the producer writes the
+# header, and each consumer only writes its own cursor, so no locks are needed. This relies on stores
+# becoming visible in program order across processes, as they do on x86. Elsewhere (ARM, POWER), a
+# consumer could see a published position before the record behind it, so both ends have to be given
+# the same multiprocessing lock, which is held to publish and to read positions and cursors.
+
+MAGIC: int = 0x52325343  # "CS2R"
+HEADER = struct.Struct(
+    "<IIQIIQQ"
+)  # magic, consumers, capacity, closed, pad, sequence, position
+CURSOR = struct.Struct("<QQ")  # sequence, position
+FRAME = struct.Struct("<IIQ")  # length, pad, sequence
+
+HEADER_SIZE: int = 64
+CURSOR_SIZE: int = 64
+WRAP: int = 0xFFFFFFFF
+
+CLOSED_OFFSET: int = 16
+SEQUENCE_OFFSET: int = 24
+POSITION_OFFSET: int = 32
+
+
+# Whether this machine makes stores visible to other processes in program order.
+ORDERED_STORES: bool = platform.machine().lower() in [
+    "x86_64",
+    "amd64",
+    "i386",
+    "i686",
+    "x86",
+]
+
+
+def check_ordering(lock):
+    if lock is None and not ORDERED_STORES:
+        raise cstruct2_memory_ordering_exception(platform.machine())
+
+
+def align(length: int) -> int:
+    return (length + 7) & ~7
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Attaches to an existing block, without making this process responsible for unlinking it."""
+
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+
+    # Before Python 3.13, attaching registers the block with the resource tracker, which would unlink
+    # it when this process exits (or complain when the producer unlinks it), so keep it from registering.
+    from multiprocessing import resource_tracker
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: (
+        None if rtype == "shared_memory" else register(name, rtype)
+    )
+
+    try:
+        return shared_memory.SharedMemory(name)
+    finally:
+        resource_tracker.register = register
+
+
+def wait(condition, timeout: float | None) -> bool:
+    """Spins (backing off to short sleeps) until condition() holds, or until timeout seconds pass."""
+
+    deadline: float | None = None if timeout is None else time.monotonic() + timeout
+    spins: int = 0
+
+    while not condition():
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+
+        spins += 1
+        if spins > 100:
+            time.sleep(min(0.001, 0.00001 * (spins - 100)))
+
+    return True
+
+
+class RingProducer:
+    """
+    The writing end of a shared memory ring buffer, carrying records of one structure, packed in the
+    structure's own format, to consumer processes. Every consumer sees every record (see RingConsumer for
+    splitting them between workers). The producer waits for the slowest consumer rather than overwrite
+    records it hasn't read. Off x86, a multiprocessing lock shared with every consumer is required.
+    """
+
+    def __init__(
+        self,
+        structure: Structure,
+        capacity: int = 1 << 24,
+        consumers: int = 1,
+        name: str | None = None,
+        lock=None,
+    ):
+        check_ordering(lock)
+
+        self.structure = structure
+        self.lock = lock
+        self.capacity: int = align(capacity)
+        self.consumers: int = consumers
+
+        self.block = shared_memory.SharedMemory(
+            name,
+            create=True,
+            size=HEADER_SIZE + consumers * CURSOR_SIZE + self.capacity,
+        )
+        self.name: str = self.block.name
+        self.buffer: memoryview = self.block.buf
+        self.data_offset: int = HEADER_SIZE + consumers * CURSOR_SIZE
+
+        self.buffer[: self.data_offset] = bytes(self.data_offset)
+        HEADER.pack_into(self.buffer, 0, MAGIC, consumers, self.capacity, 0, 0, 0, 0)
+
+        self.sequence: int = 0
+        self.position: int = 0
+
+    def __slowest(self) -> int:
+        if self.lock is not None:
+            with self.lock:
+                return self.__cursors_minimum()
+
+        return self.__cursors_minimum()
+
+    def __cursors_minimum(self) -> int:
+        return min(
+            CURSOR.unpack_from(self.buffer, HEADER_SIZE + i * CURSOR_SIZE)[1]
+            for i in range(self.consumers)
+        )
+
+    def __publish(self):
+        struct.pack_into("<Q", self.buffer, SEQUENCE_OFFSET, self.sequence)
+        struct.pack_into("<Q", self.buffer, POSITION_OFFSET, self.position)
+
+    def put(self, record: dict, timeout: float | None = None):
+        """Encodes a record into the ring, waiting up to timeout seconds for room."""
+
+        # Flat structures are packed straight into shared memory, anything else is encoded first.
+        plan: struct.Struct | None = self.structure.flat_plan
+        data: bytes | None = None
+
+        if plan is not None:
+            length: int = plan.size
+        else:
+            data = self.structure.to_bytes(record)
+            length = len(data)
+
+        frame: int = align(FRAME.size + length)
+
+        if frame > self.capacity:
+            raise cstruct2_too_big_exception("record", self.capacity, frame)
+
+        # Frames never wrap around the end of the ring: skip to the start instead.
+        offset: int = self.position % self.capacity
+        skip: int = self.capacity - offset if offset + frame > self.capacity else 0
+
+        needed: int = self.position + skip + frame - self.capacity
+        if self.__slowest() < needed and not wait(
+            lambda: self.__slowest() >= needed, timeout
+        ):
+            raise TimeoutError("The ring buffer stayed full.")
+
+        if skip:
+            struct.pack_into("<I", self.buffer, self.data_offset + offset, WRAP)
+            self.position += skip
+            offset = 0
+
+        start: int = self.data_offset + offset
+        FRAME.pack_into(self.buffer, start, length, 0, self.sequence)
+
+        if data is None:
+            self.structure.pack_flat_into(record, self.buffer, start + FRAME.size)
+        else:
+            self.buffer[start + FRAME.size : start + FRAME.size + length] = data
+
+        self.sequence += 1
+        self.position += frame
+
+        # Publishing the position is what makes the frame visible to consumers, so it goes last.
+        if self.lock is not None:
+            with self.lock:
+                self.__publish()
+        else:
+            self.__publish()
+
+    def close(self):
+        """Tells consumers no more records are coming. They still get the ones already in the ring."""
+
+        if self.lock is not None:
+            with self.lock:
+                struct.pack_into("<I", self.buffer, CLOSED_OFFSET, 1)
+        else:
+            struct.pack_into("<I", self.buffer, CLOSED_OFFSET, 1)
+
+    def unlink(self):
+        """Closes and frees the shared memory block, once consumers are done with it."""
+
+        self.close()
+        self.buffer.release()
+        self.block.close()
+        self.block.unlink()
+
+
+class MemoryReader:
+    """A read-only stream over a memoryview, so records can be decoded where they lie."""
+
+    def __init__(self, view: memoryview):
+        self.view = view
+        self.position: int = 0
+
+    def read(self, length: int) -> bytes:
+        data: bytes = bytes(self.view[self.position : self.position + length])
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        length: int = min(len(buffer), len(self.view) - self.position)
+        buffer[:length] = self.view[self.position : self.position + length]
+        self.position += length
+        return length
+
+
+class RingConsumer:
+    """
+    One reading end of a shared memory ring buffer, attached by name to a RingProducer's block, as
+    consumer number index. Records are decoded directly out of shared memory: flat structures are
+    unpacked in place, others read through a MemoryReader. To split records between workers rather than
+    have each see all of them, give each a shard of (its number, number of workers): records of other
+    shards are then skipped without being decoded. Off x86, pass the producer's lock.
+    """
+
+    def __init__(
+        self,
+        structure: Structure,
+        name: str,
+        index: int = 0,
+        shard: tuple[int, int] | None = None,
+        lock=None,
+    ):
+        check_ordering(lock)
+
+        self.structure = structure
+        self.lock = lock
+        self.block = attach(name)
+        self.buffer: memoryview = self.block.buf
+
+        magic, consumers, capacity, closed, pad, sequence, position = (
+            HEADER.unpack_from(self.buffer, 0)
+        )
+
+        if magic != MAGIC:
+            raise cstruct2_field_exception(
+                f"The shared memory block {name} is not a cstruct2 ring."
+            )
+
+        if not 0 <= index < consumers:
+            raise cstruct2_field_exception(
+                f"The ring {name} only has room for {consumers} consumers, not consumer {index}."
+            )
+
+        self.capacity: int = capacity
+        self.cursor_offset: int = HEADER_SIZE + index * CURSOR_SIZE
+        self.data_offset: int = HEADER_SIZE + consumers * CURSOR_SIZE
+        self.shard = shard
+
+        self.sequence, self.position = CURSOR.unpack_from(
+            self.buffer, self.cursor_offset
+        )
+
+    def __published(self) -> int:
+        if self.lock is not None:
+            with self.lock:
+                return struct.unpack_from("<Q", self.buffer, POSITION_OFFSET)[0]
+
+        return struct.unpack_from("<Q", self.buffer, POSITION_OFFSET)[0]
+
+    def __closed(self) -> bool:
+        if self.lock is not None:
+            with self.lock:
+                return struct.unpack_from("<I", self.buffer, CLOSED_OFFSET)[0] == 1
+
+        return struct.unpack_from("<I", self.buffer, CLOSED_OFFSET)[0] == 1
+
+    def __advance(self):
+        CURSOR.pack_into(self.buffer, self.cursor_offset, self.sequence, self.position)
+
+    def get(self, timeout: float | None = None) -> dict | None:
+        """
+        Returns the next record (of this consumer's shard), waiting up to timeout seconds for one.
+        Returns None once the producer is closed and every record has been read.
+        """
+
+        while True:
+            available = lambda: self.__published() > self.position or self.__closed()
+
+            if not wait(available, timeout):
+                raise TimeoutError("No record arrived in time.")
+
+            if self.__published() <= self.position:
+                return None
+
+            offset: int = self.position % self.capacity
+            start: int = self.data_offset + offset
+            length: int = struct.unpack_from("<I", self.buffer, start)[0]
+
+            if length == WRAP:
+                self.position += self.capacity - offset
+                continue
+
+            length, pad, sequence = FRAME.unpack_from(self.buffer, start)
+
+            if sequence != self.sequence:
+                raise cstruct2_field_exception(
+                    f"Expected record {self.sequence} in the ring, but found record {sequence}."
+                )
+
+            record: dict | None = None
+
+            if self.shard is None or sequence % self.shard[1] == self.shard[0]:
+                payload: memoryview = self.buffer[
+                    start + FRAME.size : start + FRAME.size + length
+                ]
+
+                try:
+                    # The record has to be decoded before the cursor moves on, since the producer
+                    # may reuse its space right after.
+                    if self.structure.flat_plan is not None:
+                        record = self.structure.unpack_flat(payload)
+                    else:
+                        record = self.structure.from_stream(MemoryReader(payload))
+                finally:
+                    payload.release()
+
+            self.sequence += 1
+            self.position += align(FRAME.size + length)
+
+            # Under the lock, the producer only sees the cursor move once the record has been read.
+            if self.lock is not None:
+                with self.lock:
+                    self.__advance()
+            else:
+                self.__advance()
+
+            if record is not None:
+                return record
+
+    def __iter__(self):
+        while (record := self.get()) is not None:
+            yield record
+
+    def close(self):
+        self.buffer.release()
+        self.block.close()
@@ -1,4 +1,13 @@
+import asyncio
+import mmap
+import os
 import socket
+import threading
+import time
+import zlib
+
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
 
 host_endianness = "little"
 
@@ -31,3 +40,376 @@ class SocketWrapper:
 
     def read(self, length: int) -> bytes:
         return self.sock.recv(length, socket.MSG_WAITALL if self.rw_all else 0)
+
+    def readinto(self, buffer) -> int:
+        return self.sock.recv_into(
+            buffer, len(buffer), socket.MSG_WAITALL if self.rw_all else 0
+        )
+
+
+class CachedWrapper:
+    """
+    Memoizes a wrapper, keyed on the raw decoded value handed to it. The cache is a bounded LRU,
+    optionally with entries expiring after ttl seconds. It is thread-safe, so one instance can be
+    shared by every connection of a threaded server.
+    """
+
+    def __init__(self, wrapper, maxsize: int = 1024, ttl: float | None = None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+
+        self.wrapper = wrapper
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__cache = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __call__(self, raw):
+        now = time.monotonic() if self.ttl is not None else 0
+
+        with self.__lock:
+            entry = self.__cache.get(raw)
+
+            if entry is not None and (self.ttl is None or entry[1] > now):
+                self.__cache.move_to_end(raw)
+                self.hits += 1
+                return entry[0]
+
+        # Run the (possibly slow) wrapper outside of the lock, so one miss doesn't
+        # stall every other thread hitting the cache.
+        result = self.wrapper(raw)
+
+        with self.__lock:
+            self.misses += 1
+            self.__cache[raw] = (result, now + self.ttl if self.ttl is not None else 0)
+            self.__cache.move_to_end(raw)
+
+            if len(self.__cache) > self.maxsize:
+                self.__cache.popitem(last=False)
+
+        return result
+
+    def clear(self):
+        with self.__lock:
+            self.__cache.clear()
+
+
+class DeferredValue:
+    """
+    The placeholder a DeferredWrapper puts into the resulting dictionary. The wrapper runs
+    on the first call to result(), or has already been handed off to an executor. It can also be
+    awaited from within an asyncio event loop.
+    """
+
+    def __init__(self, wrapper, raw, executor: Executor | None = None):
+        self.raw = raw
+        self.__wrapper = wrapper
+        self.__future: Future | None = None
+        self.__done = False
+        self.__value = None
+
+        if executor is not None:
+            self.__future = executor.submit(wrapper, raw)
+
+    @property
+    def future(self) -> Future | None:
+        return self.__future
+
+    def done(self) -> bool:
+        if self.__future is not None:
+            return self.__future.done()
+
+        return self.__done
+
+    def result(self, timeout: float | None = None):
+        if self.__future is not None:
+            return self.__future.result(timeout)
+
+        if not self.__done:
+            self.__value = self.__wrapper(self.raw)
+            self.__done = True
+
+        return self.__value
+
+    def __await__(self):
+        if self.__future is not None:
+            return asyncio.wrap_future(self.__future).__await__()
+
+        # Not bound to an executor: run it in the loop's default executor, not inline.
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(None, self.result).__await__()
+
+    def __repr__(self) -> str:
+        return f"DeferredValue({self.raw!r})"
+
+
+class DeferredWrapper:
+    """
+    Postpones a wrapper, so parsing only stores the raw decoded value. The wrapper runs when
+    the field is accessed through DeferredValue.result() (or awaited), or immediately on the given
+    executor, in the background, while parsing carries on.
+    """
+
+    def __init__(self, wrapper, executor: Executor | None = None):
+        self.wrapper = wrapper
+        self.executor = executor
+
+    def __call__(self, raw) -> DeferredValue:
+        return DeferredValue(self.wrapper, raw, self.executor)
+
+
+def resolve_deferred(value, timeout: float | None = None):
+    """Returns the final value of a field, whether or not it was wrapped by a DeferredWrapper."""
+
+    if isinstance(value, DeferredValue):
+        return value.result(timeout)
+
+    return value
+
+
+class InternTable:
+    """
+    A bounded table of decoded strings, keyed by their raw bytes. Repeated values skip decoding
+    entirely, and every occurrence shares one str object. Once full, new strings are still decoded
+    but no longer remembered, so the table never grows past maxsize entries. One table may be shared
+    by several fields (or structures), as long as they use the same encoding.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.__table: dict[bytes, str] = {}
+
+    def decode(self, raw: bytes, encoding: str) -> str:
+        value = self.__table.get(raw)
+
+        if value is None:
+            value = raw.decode(encoding)
+
+            if len(self.__table) < self.maxsize:
+                self.__table[raw] = value
+
+        return value
+
+    def clear(self):
+        self.__table.clear()
+
+    def __len__(self) -> int:
+        return len(self.__table)
+
+
+class BlobHandle:
+    """
+    Stands in for a lazy bytes or str field read from a seekable stream: only the offset and
+    length of the payload are recorded, and the payload itself is left in the stream until asked for.
+    The stream must stay open for as long as the handle is used.
+    """
+
+    def __init__(
+        self,
+        stream,
+        offset: int,
+        length: int,
+        encoding: str | None = None,
+        wrapper=None,
+    ):
+        self.stream = stream
+        self.offset = offset
+        self.length = length
+        self.encoding = encoding
+        self.wrapper = wrapper
+
+    def read_raw(self, start: int = 0, stop: int | None = None) -> bytes:
+        """Reads the raw bytes of the payload (or a part of it), leaving the stream position as it was."""
+
+        if stop is None or stop > self.length:
+            stop = self.length
+
+        if start >= stop:
+            return b""
+
+        position = self.stream.tell()
+
+        try:
+            self.stream.seek(self.offset + start)
+            data: bytes = self.stream.read(stop - start)
+        finally:
+            self.stream.seek(position)
+
+        if len(data) != stop - start:
+            raise EOFError()
+
+        return data
+
+    def read(self):
+        """Reads the whole payload, decoded (if it is a str field) and passed through the field's wrapper."""
+
+        value = self.read_raw()
+
+        if self.encoding is not None:
+            value = value.decode(self.encoding)
+
+        if self.wrapper is not None:
+            value = self.wrapper(value)
+
+        return value
+
+    def mmap(self) -> memoryview:
+        """
+        Maps the payload into memory, read-only, without copying it. Only works for streams backed
+        by a real file descriptor.
+        """
+
+        # mmap offsets have to be aligned to the allocation granularity.
+        aligned: int = self.offset - (self.offset % mmap.ALLOCATIONGRANULARITY)
+        delta: int = self.offset - aligned
+
+        mapping = mmap.mmap(
+            self.stream.fileno(),
+            self.length + delta,
+            access=mmap.ACCESS_READ,
+            offset=aligned,
+        )
+
+        return memoryview(mapping)[delta:]
+
+    def sendfile(self, out, start: int = 0, stop: int | None = None) -> int:
+        """
+        Sends the payload (or a part of it) to a socket or file, through os.sendfile() where
+        possible, so it never passes through userspace. Returns the number of bytes sent.
+        """
+
+        if stop is None or stop > self.length:
+            stop = self.length
+
+        out_fd: int = out if isinstance(out, int) else out.fileno()
+        offset: int = self.offset + start
+        remaining: int = stop - start
+
+        if not hasattr(os, "sendfile"):
+            return self.copy_to(os.fdopen(out_fd, "wb", closefd=False), start, stop)
+
+        in_fd: int = self.stream.fileno()
+
+        while remaining > 0:
+            sent: int = os.sendfile(out_fd, in_fd, offset, remaining)
+            if sent == 0:
+                raise EOFError()
+
+            offset += sent
+            remaining -= sent
+
+        return stop - start
+
+    def copy_to(
+        self, out, start: int = 0, stop: int | None = None, buffer_size: int = 65536
+    ) -> int:
+        """Copies the payload (or a part of it) into another stream, one reused buffer at a time."""
+
+        if stop is None or stop > self.length:
+            stop = self.length
+
+        buffer = memoryview(bytearray(buffer_size))
+        position = self.stream.tell()
+        remaining: int = stop - start
+
+        try:
+            self.stream.seek(self.offset + start)
+
+            while remaining > 0:
+                read: int = self.stream.readinto(buffer[: min(remaining, buffer_size)])
+                if not read:
+                    raise EOFError()
+
+                out.write(buffer[:read])
+                remaining -= read
+        finally:
+            self.stream.seek(position)
+
+        return stop - start
+
+    def __getitem__(self, index: slice) -> bytes:
+        if not isinstance(index, slice) or index.step not in [None, 1]:
+            raise TypeError("BlobHandle only supports contiguous slices.")
+
+        start, stop, step = index.indices(self.length)
+        return self.read_raw(start, stop)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __repr__(self) -> str:
+        return f"BlobHandle(offset={self.offset}, length={self.length})"
+
+
+class ChecksumStream:
+    """
+    Passes reads and writes through to another stream, while feeding the bytes into every checksum
+    that is currently covering them. Used by structures with checksum fields.
+    """
+
+    algorithms: dict = {"crc32": (zlib.crc32, 0), "adler32": (zlib.adler32, 1)}
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.values: dict = {}
+        self.__active: list = []
+
+    def begin(self, field):
+        function, initial = ChecksumStream.algorithms[field.algorithm]
+        self.values[field.name] = initial
+        self.__active.append((field.name, function))
+
+    def finish(self, field):
+        self.__active = [entry for entry in self.__active if entry[0] != field.name]
+
+    def __update(self, data):
+        for name, function in self.__active:
+            self.values[name] = function(data, self.values[name])
+
+    def read(self, length: int) -> bytes:
+        data: bytes = self.stream.read(length)
+        self.__update(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        readinto = getattr(self.stream, "readinto", None)
+
+        if readinto is None:
+            data: bytes = self.stream.read(len(buffer))
+            read: int = len(data)
+            buffer[:read] = data
+        else:
+            read = readinto(buffer)
+
+        self.__update(memoryview(buffer)[:read])
+        return read
+
+    def write(self, data) -> int:
+        self.__update(data)
+        return self.stream.write(data)
+
+
+class BufferReader:
+    """
+    A read-only stream over a bytes-like object, starting at a given position. Unlike BytesIO, a read
+    that cannot be satisfied in full raises EOFError, so running off the end of the buffer is never
+    mistaken for a short value.
+    """
+
+    def __init__(self, data, position: int = 0):
+        self.data = data
+        self.position: int = position
+
+    def read(self, length: int) -> bytes:
+        position: int = self.position
+        data = self.data[position : position + length]
+
+        if len(data) != length:
+            raise EOFError()
+
+        self.position = position + length
+        return data
@@ -2,17 +2,25 @@ from io import RawIOBase
 from typing import NewType, Type
 from enum import Enum
 from io import BytesIO
+from array import array
 
 from .cstruct2_exceptions import *
 from .cstruct2_fields import *
 from .cstruct2_utils import *
+from .cstruct2_columns import *
 
 import math
+import os
+import random
+import string
 import sys
 import struct
 
 double = float
 
+# Characters used for generated strings.
+GENERATED_CHARACTERS: str = string.ascii_letters + string.digits
+
 
 class Structure:
     def metafield_to_field(
@@ -122,6 +130,7 @@ class Structure:
 
             field = cstruct2_string_field(name, width, null)
 
+            field.encoding = encoding
             field.wrapper = wrapper
 
         elif datatype == "bytes":
@@ -137,7 +146,7 @@ class Structure:
         elif datatype == "switch_type":
             switch_obj: switch_type = data
 
-            if switch_obj.dependent not in self.field_names:
+            if not self.reference_exists(switch_obj.dependent):
                 raise cstruct2_switch_dependent_wrong(name, switch_obj.dependent)
 
             new_switch_obj = switch_type(switch_obj.dependent, {}, name)
@@ -157,6 +166,47 @@ class Structure:
             self.has_derived_length = True
             field = new_switch_obj
 
+        elif datatype == "checksum_type":
+            checksum_obj: checksum_type = data
+
+            if checksum_obj.algorithm not in ChecksumStream.algorithms:
+                raise cstruct2_field_exception(
+                    f"The checksum {name} uses {checksum_obj.algorithm}, but only "
+                    f"{', '.join(ChecksumStream.algorithms)} are supported."
+                )
+
+            start: str | None = checksum_obj.start
+            end: str | None = checksum_obj.end
+
+            if start is None and self.field_names:
+                start = self.field_names[0]
+
+            if end is None and self.field_names:
+                end = self.field_names[-1]
+
+            # A checksum can only cover fields that come before it.
+            for covered in [start, end]:
+                if covered not in self.field_names:
+                    raise cstruct2_variable_length_exception(name, covered)
+
+            if self.field_names.index(start) > self.field_names.index(end):
+                raise cstruct2_field_exception(
+                    f"The checksum {name} covers {start} through {end}, but {end} comes first."
+                )
+
+            field = checksum_type(
+                checksum_obj.algorithm,
+                start,
+                end,
+                relative_endianness_resolver(checksum_obj.endianness),
+                name,
+            )
+
+            self.checksum_starts.setdefault(self.field_names.index(start), []).append(
+                field
+            )
+            self.checksum_ends.setdefault(self.field_names.index(end), []).append(field)
+
         elif datatype == "Structure":
             field = cstruct2_recursive_wrapper(name, value)
 
@@ -167,7 +217,7 @@ class Structure:
             )
 
         if not isinstance(width, str) and not isinstance(width, int):
-            if datatype != "Structure" and datatype != "switch_type":
+            if datatype not in ["Structure", "switch_type", "checksum_type"]:
                 raise AttributeError(
                     f"The width, {width}, on field {name}, is not int or str."
                 )
@@ -177,7 +227,7 @@ class Structure:
             self.has_derived_length = True
 
             if not (datatype == "str" and width in ["pascal", "null"]):
-                if width not in self.field_names:
+                if not self.reference_exists(width):
                     raise cstruct2_variable_length_exception(name, width)
 
         # Anonymous fields are returned, instead of being added to the global store.
@@ -210,6 +260,13 @@ class Structure:
 
         self.has_derived_length: bool = False
 
+        # Checksum fields, by the index of the first and last field they cover.
+        self.checksum_starts: dict[int, list[checksum_type]] = {}
+        self.checksum_ends: dict[int, list[checksum_type]] = {}
+
+        # The (offset, bytes) of the constant field resync() looks for, if set_sync_marker() was used.
+        self.sync_marker: tuple[int, bytes] | None = None
+
         # We must count the number of bits taken up by bitfields to report an accurate
         # length of the structure--provided there are no variable lengths.
         self.bit_fields = 0
@@ -219,8 +276,16 @@ class Structure:
         # so we can have length derived off of the value of other previously processed fields.
         self.values = {}
 
+        # Sinks given to the current from_stream() call, and the buffer reused to fill them.
+        self.__sinks: dict = {}
+        self.__sink_buffer: memoryview | None = None
+
         self.__parse_meta_fields()
 
+        # Structures without any variable lengths are compiled into a single struct format, so that
+        # they (and any structure nesting them) decode in one read and one unpack.
+        self.__compile_flat_plan()
+
     def __parse_meta_fields(self):
         """
         Given the class that was used to instantiate this one, parse out all of the metaprogramming
@@ -235,7 +300,215 @@ class Structure:
             value = getattr(another_class, member)
             self.metafield_to_field(member, annotation, value)
 
-    def parse_width(self, width: int | str) -> int:
+    def __compile_flat_plan(self):
+        """
+        Builds the struct format and the converter that turns the flat tuple unpacked by it back into
+        the (nested) dictionary from_stream would return. Internal function: do not use.
+        """
+
+        self.flat_plan: struct.Struct | None = None
+        self.flat_converter = None
+        self.flat_flattener = None
+        self.flat_byte_order: str | None = None
+
+        if self.has_derived_length:
+            return
+
+        formats: list[str] = []
+        endiannesses: set[str] = set()
+
+        def compile_field(field):
+            # Returns a function taking an iterator over the unpacked tuple, or None if the field
+            # cannot be part of a flat plan.
+            if isinstance(field, list):
+                if not isinstance(field[1], int):
+                    return None
+
+                element = compile_field(field[2])
+                if element is None:
+                    return None
+
+                # compile_field() added the element's format once, repeat it for the rest.
+                count: int = field[1]
+                element_format = formats.pop()
+                formats.append(element_format * count)
+
+                return lambda it: [element(it) for i in range(count)]
+
+            if isinstance(field, cstruct2_recursive_wrapper):
+                another = field.another
+                if another.flat_plan is None:
+                    return None
+
+                formats.append(another.flat_plan.format[1:])
+                if another.flat_byte_order is not None:
+                    endiannesses.add(another.flat_byte_order)
+
+                converter = another.flat_converter
+                return lambda it: field.wrapper(converter(it))
+
+            if isinstance(field, cstruct2_int_field):
+                if field.width not in [1, 2, 4, 8]:
+                    return None
+
+                formats.append({1: "B", 2: "H", 4: "I", 8: "Q"}[field.width])
+                if field.width > 1:
+                    endiannesses.add(field.endianness_str)
+
+                return lambda it: field.wrapper(next(it))
+
+            if isinstance(field, cstruct2_float_field):
+                formats.append("d" if field.width == 8 else "f")
+                endiannesses.add(field.endianness_str)
+
+                return lambda it: field.wrapper(next(it))
+
+            # Lazy fields have to be skipped over in the stream, not unpacked.
+            if getattr(field, "lazy", False):
+                return None
+
+            if isinstance(field, cstruct2_bytes_field):
+                formats.append(f"{field.width}s")
+                return lambda it: field.wrapper(next(it))
+
+            if isinstance(field, cstruct2_string_field) and isinstance(
+                field.width, int
+            ):
+                formats.append(f"{field.width}s")
+                return lambda it: field.wrapper(self.decode_string(field, next(it)))
+
+            return None
+
+        converters = []
+        for name, field in zip(self.field_names, self.fields):
+            converter = compile_field(field)
+            if converter is None:
+                return
+
+            # compile_field() leaves exactly one format per field.
+            converters.append((name, converter))
+
+        # One struct format can only have one byte order.
+        if len(endiannesses) > 1:
+            return
+
+        # Single byte fields, strings and bytes don't care about byte order.
+        self.flat_byte_order = endiannesses.pop() if endiannesses else None
+
+        self.flat_plan = struct.Struct((self.flat_byte_order or "<") + "".join(formats))
+        self.flat_converter = lambda it: {
+            name: converter(it) for name, converter in converters
+        }
+
+        # The other way around: lists the leaves of a dictionary of values, in struct order.
+        def flatten_field(field):
+            if isinstance(field, list):
+                element = flatten_field(field[2])
+
+                def flatten_list(value, leaves: list):
+                    for item in value:
+                        element(item, leaves)
+
+                return flatten_list
+
+            if isinstance(field, cstruct2_recursive_wrapper):
+                flattener = field.another.flat_flattener
+
+                def flatten_structure(value, leaves: list):
+                    self.__ws_value_checker([dict], value)
+                    flattener(value, leaves)
+
+                return flatten_structure
+
+            # The same checks as write_field(): struct.pack_into() would silently truncate
+            # strings and bytes that are too long, and fail on integers with a bare struct.error.
+            if isinstance(field, cstruct2_int_field):
+                limit: int = 1 << (8 * field.width)
+
+                def flatten_int(value, leaves: list):
+                    self.__ws_value_checker([int], value)
+
+                    if not 0 <= value < limit:
+                        raise cstruct2_too_big_exception(
+                            field.name, field.width, (value.bit_length() + 7) // 8
+                        )
+
+                    leaves.append(value)
+
+                return flatten_int
+
+            if isinstance(field, cstruct2_float_field):
+
+                def flatten_float(value, leaves: list):
+                    self.__ws_value_checker([float, int], value)
+                    leaves.append(value)
+
+                return flatten_float
+
+            allowed: list = [
+                str if isinstance(field, cstruct2_string_field) else bytes,
+                BlobHandle,
+            ]
+
+            def flatten_bytes(value, leaves: list):
+                self.__ws_value_checker(allowed, value)
+
+                # Lazy values are copied over as their raw, still encoded, bytes.
+                if isinstance(value, BlobHandle):
+                    data: bytes = value.read_raw()
+                elif isinstance(value, str):
+                    data = value.encode(field.encoding)
+                else:
+                    data = value
+
+                if len(data) > field.width:
+                    raise cstruct2_too_big_exception(field.name, field.width, len(data))
+
+                leaves.append(data)
+
+            return flatten_bytes
+
+        flatteners = [
+            (name, flatten_field(field))
+            for name, field in zip(self.field_names, self.fields)
+        ]
+
+        def flatten(values: dict, leaves: list):
+            for name, flattener in flatteners:
+                flattener(values[name], leaves)
+
+        self.flat_flattener = flatten
+
+    def unpack_flat(self, data) -> dict:
+        """Converts bytes laid out by this (flat) structure into its dictionary of values."""
+
+        return self.flat_converter(iter(self.flat_plan.unpack(data)))
+
+    def pack_flat_into(self, values: dict, buffer, offset: int = 0):
+        """Packs a dictionary of values for this (flat) structure straight into a writable buffer."""
+
+        leaves: list = []
+        self.flat_flattener(values, leaves)
+        self.flat_plan.pack_into(buffer, offset, *leaves)
+
+    def reference_exists(self, reference: str) -> bool:
+        """
+        Checks whether a width or switch reference names an already processed field, following
+        . member accessors into nested structures.
+        """
+
+        tokens = reference.split(".")
+        field = self.field_correspondence.get(tokens[0])
+
+        for token in tokens[1:]:
+            if not isinstance(field, cstruct2_recursive_wrapper):
+                return False
+
+            field = field.another.field_correspondence.get(token)
+
+        return field is not None
+
+    def parse_width(self, width: int | str, values: dict | None = None) -> int:
         """
         Parses width parameters. If string and variable, from an existing value in the structure.
         Objects within nested structures can be referenced using a . member accessor operator.
@@ -244,13 +517,16 @@ class Structure:
         if isinstance(width, int):
             return width
 
+        if values is None:
+            values = self.values
+
         tokens = width.split(".")
-        current_level = self.values[tokens[0]]
+        current_level = values[tokens[0]]
 
         for i in range(1, len(tokens)):
             current_level = current_level[tokens[i]]
 
-        return current_level[width]
+        return current_level
 
     def parse_field(self, stream, field, recursive=False):
         """
@@ -280,6 +556,7 @@ class Structure:
         # This is clunky, but it just werkz!!11
         if (
             not isinstance(field, cstruct2_recursive_wrapper)
+            and not isinstance(field, checksum_type)
             and not isinstance(field, switch_type)
             and not isinstance(field, list)
         ):
@@ -299,7 +576,7 @@ class Structure:
             absolute_width in ["null", "pascal"]
         ):
             tmp = absolute_width
-            absolute_width = self.values[absolute_width]
+            absolute_width = self.parse_width(absolute_width)
 
             # If the variable length for an int or a float is not within the capable
             # byte lengths for C binary structures.
@@ -315,11 +592,31 @@ class Structure:
         # which is simply an array of fields that must be evaluated recursively.
         # The list is in the form [resulting field name, number of elements, field in array]
         if isinstance(field, list):
-            values[field[0]] = []
+            element = field[2]
+
+            # An array of flat structures is read in one go and unpacked element by element.
+            if (
+                isinstance(element, cstruct2_recursive_wrapper)
+                and element.another.flat_plan is not None
+            ):
+                plan: struct.Struct = element.another.flat_plan
+                converter = element.another.flat_converter
+
+                data: bytes = stream.read(plan.size * absolute_width)
+                if len(data) != plan.size * absolute_width:
+                    raise EOFError()
+
+                values[field[0]] = [
+                    element.wrapper(converter(iter(unpacked)))
+                    for unpacked in plan.iter_unpack(data)
+                ]
+
+            else:
+                values[field[0]] = []
 
-            for i in range(absolute_width):
-                value = self.parse_field(stream, field[2], True)
-                values[field[0]].append(value)
+                for i in range(absolute_width):
+                    value = self.parse_field(stream, element, True)
+                    values[field[0]].append(value)
 
         elif isinstance(field, cstruct2_number_field):
             values[field.name] = wrapper(
@@ -336,38 +633,86 @@ class Structure:
             )
 
         elif isinstance(field, cstruct2_string_field):
-            values[field.name] = ""
+            # Pascal-style strings have a leading byte that describes their length.
+            if absolute_width == "pascal":
+                absolute_width = int.from_bytes(stream.read(1))
+
+            if field.name in self.__sinks and absolute_width != "null":
+                # The value is the sink itself: the wrapper is meant for the field's value, not for it.
+                values[field.name] = self.__read_into_sink(
+                    stream, absolute_width, self.__sinks[field.name]
+                )
+
+            elif field.lazy and self.__is_seekable(stream):
+                values[field.name] = self.__skip_lazy(
+                    stream, absolute_width, field.encoding, wrapper
+                )
 
             # Null-terminated string has indeterminate length
-            if absolute_width == "null":
+            elif absolute_width == "null":
+                raw = bytearray()
                 while (c := stream.read(1)) != b"\0":
-                    values[field.name] += wrapper(c.decode())
+                    if not c:
+                        raise EOFError()
+
+                    raw += c
+
+                values[field.name] = wrapper(self.decode_string(field, bytes(raw)))
 
             else:
-                # Pascal-style strings have a leading byte that describes their length.
-                if absolute_width == "pascal":
-                    absolute_width = int.from_bytes(stream.read(1))
-
-                # Buffering reads from a stream is more efficient...
-                # at least in C it is...
-                whole: int = absolute_width // self.__buffer_size
-                frac: int = absolute_width % self.__buffer_size
-
-                for i in range(whole):
-                    values[field.name] += wrapper(
-                        stream.read(self.__buffer_size).decode(field.encoding)
-                    )
+                if absolute_width <= self.__buffer_size:
+                    raw = stream.read(absolute_width)
 
-                if frac:
-                    values[field.name] += wrapper(
-                        stream.read(frac).decode(field.encoding)
-                    )
+                else:
+                    # Buffering reads from a stream is more efficient...
+                    # at least in C it is...
+                    whole: int = absolute_width // self.__buffer_size
+                    frac: int = absolute_width % self.__buffer_size
+
+                    chunks: list[bytes] = [
+                        stream.read(self.__buffer_size) for i in range(whole)
+                    ]
+
+                    if frac:
+                        chunks.append(stream.read(frac))
+
+                    raw = b"".join(chunks)
+
+                # Decoding happens once, over the whole string, so multi-byte characters
+                # can't be split across chunks, and the wrapper sees the whole value.
+                values[field.name] = wrapper(self.decode_string(field, raw))
 
         elif isinstance(field, cstruct2_bytes_field):
-            values[field.name] = wrapper(stream.read(absolute_width))
+            if field.name in self.__sinks:
+                # The value is the sink itself: the wrapper is meant for the field's value, not for it.
+                values[field.name] = self.__read_into_sink(
+                    stream, absolute_width, self.__sinks[field.name]
+                )
+
+            elif field.lazy and self.__is_seekable(stream):
+                values[field.name] = self.__skip_lazy(
+                    stream, absolute_width, None, wrapper
+                )
+
+            else:
+                values[field.name] = wrapper(stream.read(absolute_width))
+
+        elif isinstance(field, checksum_type):
+            expected: int = int.from_bytes(stream.read(4), byteorder=field.endianness)
+
+            if not isinstance(stream, ChecksumStream):
+                raise cstruct2_field_exception(
+                    f"The checksum {field.name} can only be read through from_stream()."
+                )
+
+            computed: int = stream.values[field.name]
+            if expected != computed:
+                raise cstruct2_checksum_exception(field.name, expected, computed)
+
+            values[field.name] = wrapper(expected)
 
         elif isinstance(field, switch_type):
-            dependent_value = self.values[field.dependent]
+            dependent_value = self.parse_width(field.dependent)
             resulting_field = field.decisions[dependent_value]
 
             # The field name itself of the switch field will be used to store
@@ -376,9 +721,20 @@ class Structure:
             values[field.name] = self.parse_field(stream, resulting_field, True)
 
         elif isinstance(field, cstruct2_recursive_wrapper):
-            # Recursively parse the other structure.
-            tmp = field.another.from_stream(stream)
-            values[field.name] = field.wrapper(tmp)
+            another: Structure = field.another
+
+            # Flat structures are decoded inline, without going through their own from_stream.
+            if another.flat_plan is not None:
+                data: bytes = stream.read(another.flat_plan.size)
+                if len(data) != another.flat_plan.size:
+                    raise EOFError()
+
+                values[field.name] = field.wrapper(another.unpack_flat(data))
+
+            else:
+                # Recursively parse the other structure.
+                tmp = another.from_stream(stream)
+                values[field.name] = field.wrapper(tmp)
 
         else:
             ...  # ???
@@ -388,39 +744,521 @@ class Structure:
 
         return values
 
-    def from_stream(self, stream: RawIOBase) -> dict:
+    def __is_seekable(self, stream) -> bool:
+        seekable = getattr(stream, "seekable", None)
+        return seekable is not None and seekable()
+
+    def __skip_lazy(
+        self, stream, length: int, encoding: str | None, wrapper
+    ) -> BlobHandle:
+        """Records where a lazy field's payload is, then seeks past it. Internal function: do not use."""
+
+        offset: int = stream.tell()
+
+        # Seeking past the end of a file is allowed, so check the payload is actually there.
+        end: int = stream.seek(0, os.SEEK_END)
+        if offset + length > end:
+            raise EOFError()
+
+        stream.seek(offset + length)
+        return BlobHandle(stream, offset, length, encoding, wrapper)
+
+    def __read_into_sink(self, stream, length: int, sink):
+        """
+        Delivers a field's payload to a sink, chunk by chunk, through one reused buffer. The sink can be
+        anything with a write() (like a file) or update() (like a hash) method, or a plain callable.
+        Internal function: do not use.
+        """
+
+        if hasattr(sink, "write"):
+            deliver = sink.write
+        elif hasattr(sink, "update"):
+            deliver = sink.update
+        else:
+            deliver = sink
+
+        if self.__sink_buffer is None or len(self.__sink_buffer) != self.__buffer_size:
+            self.__sink_buffer = memoryview(bytearray(self.__buffer_size))
+
+        buffer: memoryview = self.__sink_buffer
+        readinto = getattr(stream, "readinto", None)
+        remaining: int = length
+
+        while remaining > 0:
+            view: memoryview = buffer[: min(remaining, len(buffer))]
+
+            if readinto is not None:
+                read: int = readinto(view)
+            else:
+                data: bytes = stream.read(len(view))
+                read = len(data)
+                view[:read] = data
+
+            if not read:
+                raise EOFError()
+
+            deliver(view[:read])
+            remaining -= read
+
+        return sink
+
+    def decode_string(self, field: cstruct2_string_field, raw: bytes) -> str:
+        """
+        Decodes the raw bytes of a string field, applying padding stripping and interning
+        if they are enabled on the field.
+        """
+
+        if field.strip_padding:
+            raw = raw.rstrip(b"\0")
+
+        if field.intern_table is not None:
+            return field.intern_table.decode(raw, field.encoding)
+
+        return raw.decode(field.encoding)
+
+    def from_stream(self, stream: RawIOBase, sinks: dict | None = None) -> dict:
         """
         From any file-like object, read the structure and return a dictionary
         of its high-level, processed contents. Basically a for loop over all fields
         and usage of the parse_field member. Want to read from a bytes object? Seek BytesIO
+
+        sinks maps the names of bytes or str fields to a sink (a file, a hash object, or a callable)
+        that the field's raw bytes are streamed into, instead of being kept in memory. The
+        field's value in the result is then the sink itself, and its wrapper is not applied.
         """
 
         # if not issubclass(stream, RawIOBase):
         #    raise TypeError("stream must be a file-like object (derived from RawIOBase)")
 
         self.values = {}
+        self.__sinks = sinks or {}
 
         try:
-            for field in self.fields:
-                self.parse_field(stream, field)
+            if self.flat_plan is not None and not self.__sinks:
+                data: bytes = stream.read(self.flat_plan.size)
+                if len(data) != self.flat_plan.size:
+                    raise EOFError()
+
+                self.values = self.unpack_flat(data)
+                return self.values.copy()
+
+            if self.checksum_starts:
+                self.__parse_checksummed(stream)
+
+            else:
+                for field in self.fields:
+                    self.parse_field(stream, field)
 
         except EOFError:
             raise cstruct2_overflow_exception(None)
 
+        finally:
+            self.__sinks = {}
+
         return self.values.copy()
 
+    def __make_column(self, field):
+        """Makes the empty column a field is decoded into. Internal function: do not use."""
+
+        if isinstance(field, list):
+            return ListColumn(self.__make_column(field[2]))
+
+        if isinstance(field, cstruct2_recursive_wrapper):
+            return field.another.__make_columns()
+
+        if isinstance(field, switch_type):
+            # Switch values can be of any type, so they stay Python objects.
+            return []
+
+        if isinstance(field, (cstruct2_int_field, checksum_type)):
+            return array(int_typecode(field.width))
+
+        if isinstance(field, cstruct2_float_field):
+            return array("f" if field.width == 4 else "d")
+
+        if isinstance(field, cstruct2_string_field):
+            return BinaryColumn(field.encoding)
+
+        return BinaryColumn()
+
+    def __make_columns(self) -> dict:
+        return {
+            name: self.__make_column(field)
+            for name, field in zip(self.field_names, self.fields)
+        }
+
+    def __read_exactly(self, stream, length: int) -> bytes:
+        data: bytes = stream.read(length)
+        if len(data) != length:
+            raise EOFError()
+
+        return data
+
+    def __parse_column(self, stream, field, column, name: str | None):
+        """
+        Reads a field and appends its raw value to its column. Scalar values are also kept in self.values,
+        under their name (strings decoded, but not wrapped), for the widths and switches referring to them.
+        Internal function: do not use.
+        """
+
+        if isinstance(field, list):
+            count: int = self.parse_width(field[1])
+
+            for i in range(count):
+                self.__parse_column(stream, field[2], column.values, None)
+
+            column.offsets.append(column.offsets[-1] + count)
+
+        elif isinstance(field, cstruct2_recursive_wrapper):
+            another: Structure = field.another
+            another.__parse_columns(stream, column)
+
+            # Lets dotted references look into the nested structure.
+            if name is not None:
+                self.values[name] = another.values
+
+        elif isinstance(field, switch_type):
+            # The decision goes through a column of its own, so that it's read raw, like every other column.
+            decision = field.decisions[self.parse_width(field.dependent)]
+            cell = self.__make_column(decision)
+            self.__parse_column(stream, decision, cell, None)
+            column.append(column_value(cell, 0))
+
+        elif isinstance(field, (cstruct2_int_field, checksum_type)):
+            width: int = self.parse_width(field.width)
+            value: int = int.from_bytes(
+                self.__read_exactly(stream, width), byteorder=field.endianness
+            )
+
+            column.append(value)
+            if name is not None:
+                self.values[name] = value
+
+        elif isinstance(field, cstruct2_float_field):
+            width = self.parse_width(field.width)
+            data: bytes = self.__read_exactly(stream, width)
+            value: float = struct.unpack(
+                f"{field.endianness_str}{'d' if width == 8 else 'f'}", data
+            )[0]
+
+            column.append(value)
+            if name is not None:
+                self.values[name] = value
+
+        elif isinstance(field, cstruct2_string_field):
+            if field.width == "null":
+                raw = bytearray()
+                while (c := stream.read(1)) != b"\0":
+                    if not c:
+                        raise EOFError()
+
+                    raw += c
+
+            else:
+                width = (
+                    int.from_bytes(self.__read_exactly(stream, 1))
+                    if field.width == "pascal"
+                    else self.parse_width(field.width)
+                )
+                raw = self.__read_exactly(stream, width)
+
+                if field.strip_padding:
+                    raw = raw.rstrip(b"\0")
+
+            column.append(raw)
+            if name is not None:
+                self.values[name] = self.decode_string(field, bytes(raw))
+
+        elif isinstance(field, cstruct2_bytes_field):
+            raw = self.__read_exactly(stream, self.parse_width(field.width))
+
+            column.append(raw)
+            if name is not None:
+                self.values[name] = raw
+
+    def __parse_columns(self, stream, columns: dict):
+        """Reads one record into a column set. Internal function: do not use."""
+
+        for name, field in zip(self.field_names, self.fields):
+            self.__parse_column(stream, field, columns[name], name)
+
+    def __parse_flat_columns(self, stream, columns: dict, n: int | None) -> int:
+        """
+        Reads records of a flat structure of scalar fields in large batches, unpacking each batch
+        with one iter_unpack() and extending every column at once. Internal function: do not use.
+        """
+
+        plan: struct.Struct = self.flat_plan
+        batch: int = max(1, (self.__buffer_size * 256) // plan.size)
+        count: int = 0
+
+        while n is None or count < n:
+            wanted: int = batch if n is None else min(batch, n - count)
+            size: int = wanted * plan.size
+            data: bytes = stream.read(size)
+
+            # Raw streams (sockets, pipes) can return less than asked for well before their end.
+            ended: bool = len(data) < size
+            while data and ended:
+                more: bytes = stream.read(size - len(data))
+                if not more:
+                    break
+
+                data += more
+                ended = len(data) < size
+
+            if len(data) % plan.size or (
+                n is not None and len(data) != wanted * plan.size
+            ):
+                raise EOFError()
+
+            if not data:
+                break
+
+            rows = list(plan.iter_unpack(data))
+            count += len(rows)
+
+            for field, column, cells in zip(self.fields, columns.values(), zip(*rows)):
+                if isinstance(field, cstruct2_string_field) and field.strip_padding:
+                    column.extend(cell.rstrip(b"\0") for cell in cells)
+                else:
+                    column.extend(cells)
+
+            if ended:
+                break
+
+        return count
+
+    def from_stream_columnar(self, stream, n: int | None = None) -> dict:
+        """
+        Reads n records (or, for seekable or peekable streams, every record until the end of the stream)
+        into a column set instead of n dictionaries. The result maps each field name to its column:
+        integers and floats to an array.array, bytes and str to a BinaryColumn, arrays to a ListColumn,
+        nested structures to a dictionary of their own columns, and switches to a list. Columns hold raw
+        values: wrappers, lazy fields and interning do not apply.
+        """
+
+        columns: dict = self.__make_columns()
+
+        try:
+            scalar: bool = all(
+                isinstance(
+                    field,
+                    (
+                        cstruct2_number_field,
+                        cstruct2_float_field,
+                        cstruct2_bytes_field,
+                        cstruct2_string_field,
+                    ),
+                )
+                for field in self.fields
+            )
+
+            if self.flat_plan is not None and scalar:
+                self.__parse_flat_columns(stream, columns, n)
+                return columns
+
+            at_end = None
+            if n is None:
+                at_end = self.__end_detector(stream)
+
+            self.values = {}
+            count: int = 0
+
+            while n is None or count < n:
+                if at_end is not None and at_end():
+                    break
+
+                self.__parse_columns(stream, columns)
+                count += 1
+
+        except EOFError:
+            raise cstruct2_overflow_exception(None)
+
+        return columns
+
+    def __end_detector(self, stream):
+        """Returns a function telling whether a stream has been read to its end. Internal function: do not use."""
+
+        if hasattr(stream, "peek"):
+            return lambda: not stream.peek(1)
+
+        if self.__is_seekable(stream):
+            position: int = stream.tell()
+            end: int = stream.seek(0, os.SEEK_END)
+            stream.seek(position)
+
+            return lambda: stream.tell() >= end
+
+        raise cstruct2_field_exception(
+            "The number of records must be given for streams that can neither seek nor peek."
+        )
+
+    def from_bytes_columnar(self, data: bytes, n: int | None = None) -> dict:
+        """Reads records packed back to back in a bytes object into a column set."""
+
+        return self.from_stream_columnar(BytesIO(data), n)
+
+    def __parse_checksummed(self, stream):
+        """
+        Parses every field, through a stream that feeds each checksum the bytes of the fields it covers.
+        Internal function: do not use.
+        """
+
+        stream = ChecksumStream(stream)
+
+        for index, field in enumerate(self.fields):
+            for checksum_field in self.checksum_starts.get(index, []):
+                stream.begin(checksum_field)
+
+            self.parse_field(stream, field)
+
+            for checksum_field in self.checksum_ends.get(index, []):
+                stream.finish(checksum_field)
+
     def from_bytes(self, data: bytes) -> dict:
         """Reads a packed binary structure in the cstruct2 format from a bytes object."""
 
-        stream = BytesIO(bytes)
+        stream = BytesIO(data)
         return self.from_stream(stream)
 
+    def resync(
+        self,
+        stream,
+        on_skip=None,
+        validate=None,
+        confirm: bool = False,
+        max_length: int = 1 << 16,
+        chunk_size: int = 1 << 20,
+    ):
+        """
+        Reads records until the end of a stream that may contain corrupt or misaligned data, yielding
+        every record that decodes cleanly. The stream is read in chunks of chunk_size bytes, and
+        bytes.find() is used over them to jump to the next occurrence of the sync marker (see
+        set_sync_marker). A candidate record is only accepted if:
+
+         - it decodes without any exception, including checksum mismatches
+         - it is at most max_length bytes long
+         - validate(record), if given, returns True
+         - with confirm set, the next sync marker comes right after it (or there is none)
+
+        confirm is a stricter check for structures without checksum fields, where a stray marker in
+        garbage could decode by chance. It comes at a cost: the good record right before a corrupt
+        region is dropped too, as nothing valid follows it. Records verified by a checksum field are
+        always trusted without it. Every run of bytes skipped over is reported as on_skip(start, end),
+        in stream offsets.
+        """
+
+        if self.sync_marker is None:
+            raise cstruct2_field_exception(
+                "resync() needs a sync marker to look for: see set_sync_marker()."
+            )
+
+        marker_offset, marker = self.sync_marker
+        marker_end: int = marker_offset + len(marker)
+
+        # The buffer always holds a whole record plus the marker of the next one, unless the stream ended.
+        # Chunks are kept well above that, so that the leftover bytes copied on each refill stay cheap.
+        wanted: int = max_length + marker_end
+        chunk_size = max(chunk_size, 4 * wanted)
+
+        # A record that passed its checksums needs no confirmation from the one after it.
+        confirm = confirm and not self.checksum_starts
+
+        data: bytes = b""
+        base: int = 0  # offset of data[0] in the stream
+        position: int = 0  # where the next record is expected to start, in data
+        skip_start: int | None = None
+        eof: bool = False
+        reader = BufferReader(data)
+
+        # Flat structures are unpacked straight out of the buffer.
+        flat_plan: struct.Struct | None = self.flat_plan
+
+        while True:
+            if not eof and len(data) - position < wanted:
+                chunk: bytes = stream.read(chunk_size)
+                eof = not chunk
+
+                data = data[position:] + chunk
+                base += position
+                position = 0
+                reader.data = data
+                continue
+
+            if position >= len(data):
+                break
+
+            if not data.startswith(marker, position + marker_offset):
+                if skip_start is None:
+                    skip_start = base + position
+
+                found: int = data.find(marker, position + marker_offset)
+
+                if found == -1:
+                    # The end of the buffer could still hold the start of a marker.
+                    position = (
+                        len(data) if eof else max(position, len(data) - marker_end + 1)
+                    )
+                else:
+                    position = found - marker_offset
+
+                continue
+
+            try:
+                if flat_plan is not None:
+                    record: dict = self.flat_converter(
+                        iter(flat_plan.unpack_from(data, position))
+                    )
+                    end: int = position + flat_plan.size
+                else:
+                    reader.position = position
+                    record = self.from_stream(reader)
+                    end = reader.position
+
+                valid: bool = end - position <= max_length and (
+                    validate is None or validate(record)
+                )
+
+                if (
+                    valid
+                    and confirm
+                    and not data.startswith(marker, end + marker_offset)
+                ):
+                    # Only the last record of the stream may be followed by something else.
+                    valid = eof and data.find(marker, end + marker_offset) == -1
+
+            # Corrupt data can make decoding (or wrappers) fail in any number of ways.
+            except Exception:
+                valid = False
+
+            if not valid:
+                if skip_start is None:
+                    skip_start = base + position
+
+                position += 1
+                continue
+
+            if skip_start is not None:
+                if on_skip is not None:
+                    on_skip(skip_start, base + position)
+
+                skip_start = None
+
+            position = end
+            yield record
+
+        if skip_start is not None and on_skip is not None:
+            on_skip(skip_start, base + len(data))
+
     def __ws_value_checker(self, allowed: list, given):
         for good in allowed:
             if isinstance(given, good):
                 return
 
-        raise cstruct2_invalid_value_exception(type(given), allowed)
+        raise cstruct2_invalid_value_exception(
+            type(given).__name__, [good.__name__ for good in allowed]
+        )
 
     def write_field(self, values: dict, value, field, stream):
         """
@@ -440,9 +1278,13 @@ class Structure:
         ):
             absolute_width = field.width
 
+        # Derived widths come from the values being written.
+        if isinstance(absolute_width, str) and absolute_width not in ["null", "pascal"]:
+            absolute_width = self.parse_width(absolute_width, values)
+
         if isinstance(field, list):
             self.__ws_value_checker([list], value)
-            for i in range(field[1]):
+            for i in range(self.parse_width(field[1], values)):
                 self.write_field(values, value[i], field[2], stream)
 
         elif isinstance(field, cstruct2_recursive_wrapper):
@@ -461,46 +1303,75 @@ class Structure:
             stream.write(data)
 
         elif isinstance(field, cstruct2_float_field):
+            self.__ws_value_checker([float, int], value)
+
             float_size = "d" if absolute_width == 8 else "f"
             stream.write(struct.pack(f"{field.endianness_str}{float_size}", value))
 
         elif isinstance(field, cstruct2_string_field):
-            self.__ws_value_checker([str], value)
+            self.__ws_value_checker([str, BlobHandle], value)
+
+            # Lazy strings are copied over as their raw, still encoded, bytes.
+            data: bytes | BlobHandle = (
+                value if isinstance(value, BlobHandle) else value.encode(field.encoding)
+            )
 
-            data: bytes = value.encode()
             if field.width == "pascal":
-                stream.write(int.to_bytes(len(data), "little"))
+                if len(data) > 255:
+                    raise cstruct2_too_big_exception(field.name, 255, len(data))
 
-            stream.write(data)
+                stream.write(len(data).to_bytes(1, "little"))
 
-            # Null terminated string.
-            if field.width == "null":
-                data += b"\0"
+            elif field.width != "null" and len(data) > absolute_width:
+                raise cstruct2_too_big_exception(field.name, absolute_width, len(data))
 
+            if isinstance(data, BlobHandle):
+                data.copy_to(stream, buffer_size=self.__buffer_size)
             else:
-                if field.width not in ["pascal", "pascal16", "pascal32"]:
-                    if len(data) > absolute_width:
-                        raise cstruct2_too_big_exception(
-                            field.name, absolute_width, len(data)
-                        )
+                stream.write(data)
 
-                    padding: int = absolute_width - len(data)
-                    stream.write(b"\x00" * padding)
+            # Null terminated string.
+            if field.width == "null":
+                stream.write(b"\0")
+
+            elif field.width != "pascal":
+                padding: int = absolute_width - len(data)
+                stream.write(b"\x00" * padding)
 
         elif isinstance(field, cstruct2_bytes_field):
-            self.__ws_value_checker([bytes], value)
+            self.__ws_value_checker([bytes, BlobHandle], value)
 
             if len(value) > absolute_width:
                 raise cstruct2_too_big_exception(field.name, absolute_width, len(value))
 
-            stream.write(value)
+            # Lazy fields are copied straight from their source, without loading them whole.
+            if isinstance(value, BlobHandle):
+                value.copy_to(stream, buffer_size=self.__buffer_size)
+            else:
+                stream.write(value)
 
             # Apply padding if necessary.
             if (absolute_width - len(value)) > 0:
-                stream.write(b"\x00" * absolute_width - len(value))
+                stream.write(b"\x00" * (absolute_width - len(value)))
+
+        elif isinstance(field, checksum_type):
+            if value is None:
+                if not isinstance(stream, ChecksumStream):
+                    raise cstruct2_field_exception(
+                        f"The checksum {field.name} can only be filled in through to_stream()."
+                    )
+
+                value = stream.values[field.name]
+
+                # A None placeholder in the values gets the checksum filled in.
+                if field.name in values:
+                    values[field.name] = value
+
+            self.__ws_value_checker([int], value)
+            stream.write(value.to_bytes(4, byteorder=field.endianness))
 
         elif isinstance(field, switch_type):
-            actual_field = field.decisions[values[field.dependent]]
+            actual_field = field.decisions[self.parse_width(field.dependent, values)]
             self.write_field(values, value, actual_field, stream)
 
         else:
@@ -509,25 +1380,195 @@ class Structure:
     def to_stream(self, values: dict, stream: RawIOBase):
         """Given a dictionary of values conforming to this structure, write it to a stream."""
 
-        try:
-            # For each key in the values provided, find out what fields they're supposed to be
-            # so we can write the correct value to the stream.
+        for key in values:
+            if key not in self.field_correspondence:
+                raise cstruct2_non_existent_field_exception(key)
 
-            for key, value in values.items():
-                if key not in self.field_names:
-                    raise cstruct2_non_existent_field_exception(key)
+        if self.checksum_starts:
+            stream = ChecksumStream(stream)
 
-                self.write_field(values, value, self.field_correspondence[key], stream)
+        # Fields are written in the order the structure declares them, whatever order the
+        # dictionary happens to be in. Fields missing from the dictionary are left out,
+        # apart from checksums, which are computed if they're missing or None.
+        for index, (name, field) in enumerate(zip(self.field_names, self.fields)):
+            for checksum_field in self.checksum_starts.get(index, []):
+                stream.begin(checksum_field)
 
-        except:
-            ...
+            if name in values or isinstance(field, checksum_type):
+                self.write_field(values, values.get(name), field, stream)
+
+            for checksum_field in self.checksum_ends.get(index, []):
+                stream.finish(checksum_field)
 
     def to_bytes(self, values: dict) -> bytes:
         """Converts the values corresponding to the field values to a bytes object."""
 
         output = BytesIO()
         self.to_stream(values, output)
-        return output.read()
+        return output.getvalue()
+
+    def __reference_constraints(self) -> dict[str, tuple]:
+        """
+        Works out which fields others depend on, and what values they may take for a generated
+        record to stay valid. Internal function: do not use.
+        """
+
+        constraints: dict[str, tuple] = {}
+        pending = list(self.fields)
+
+        while pending:
+            field = pending.pop()
+
+            if isinstance(field, list):
+                if isinstance(field[1], str):
+                    constraints[field[1]] = ("length",)
+
+                pending.append(field[2])
+
+            elif isinstance(field, switch_type):
+                constraints[field.dependent] = ("choice", list(field.decisions.keys()))
+                pending.extend(field.decisions.values())
+
+            elif isinstance(field, (cstruct2_recursive_wrapper, checksum_type)):
+                continue
+
+            elif isinstance(field.width, str) and field.width not in ["null", "pascal"]:
+                if isinstance(field, cstruct2_int_field):
+                    constraints[field.width] = ("choice", [1, 2, 4, 8])
+                elif isinstance(field, cstruct2_float_field):
+                    constraints[field.width] = ("choice", [4, 8])
+                else:
+                    constraints[field.width] = ("length",)
+
+        return constraints
+
+    def __generate_value(
+        self,
+        field,
+        rng: random.Random,
+        values: dict,
+        constraints: dict,
+        max_length: int,
+    ):
+        """Makes up a valid raw value for a field. Internal function: do not use."""
+
+        if isinstance(field, list):
+            count: int = self.parse_width(field[1], values)
+            return [
+                self.__generate_value(field[2], rng, values, constraints, max_length)
+                for i in range(count)
+            ]
+
+        # Fields that switches depend on, whatever their type, take one of the decision keys.
+        constraint: tuple | None = constraints.get(field.name)
+        if constraint is not None and constraint[0] == "choice":
+            return rng.choice(constraint[1])
+
+        if isinstance(field, switch_type):
+            decision = field.decisions[self.parse_width(field.dependent, values)]
+            return self.__generate_value(decision, rng, values, constraints, max_length)
+
+        if isinstance(field, checksum_type):
+            # Filled in when the record is encoded.
+            return None
+
+        if isinstance(field, cstruct2_recursive_wrapper):
+            # Constraints on the nested structure's fields, from dotted references in this one.
+            prefix: str = f"{field.name}."
+            nested: dict = {
+                reference[len(prefix) :]: constraint
+                for reference, constraint in constraints.items()
+                if reference.startswith(prefix)
+            }
+
+            return field.another.__generate_record(rng, nested, max_length)
+
+        width = field.width
+        if isinstance(width, str) and width not in ["null", "pascal"]:
+            width = self.parse_width(width, values)
+
+        if isinstance(field, cstruct2_int_field):
+            if constraint is None:
+                return rng.getrandbits(8 * width)
+
+            return rng.randint(0, min(max_length, (1 << (8 * width)) - 1))
+
+        if isinstance(field, cstruct2_float_field):
+            value: float = rng.uniform(-1e6, 1e6)
+
+            # Round to what a 4 byte float can actually hold, so the record survives encoding.
+            if width == 4:
+                value = struct.unpack("<f", struct.pack("<f", value))[0]
+
+            return value
+
+        if isinstance(field, cstruct2_bytes_field):
+            return rng.randbytes(width)
+
+        if isinstance(field, cstruct2_string_field):
+            if width == "null":
+                width = rng.randint(0, max_length)
+            elif width == "pascal":
+                width = rng.randint(0, min(max_length, 255))
+
+            # Plain ASCII letters and digits are the same size in every encoding we care about,
+            # and contain no null bytes.
+            return "".join(rng.choices(GENERATED_CHARACTERS, k=width))
+
+        raise cstruct2_field_exception(
+            f"Cannot generate a value for the field {field.name}."
+        )
+
+    def __generate_record(
+        self, rng: random.Random, constraints: dict, max_length: int
+    ) -> dict:
+        """Makes up one valid record of raw values. Internal function: do not use."""
+
+        # Constraints from structures nesting this one take precedence.
+        constraints = {**self.__reference_constraints(), **constraints}
+        record: dict = {}
+
+        for name, field in zip(self.field_names, self.fields):
+            record[name] = self.__generate_value(
+                field, rng, record, constraints, max_length
+            )
+
+        return record
+
+    def generate(self, n: int, seed=None, max_length: int = 16):
+        """
+        Yields n random, valid (record, encoded bytes) pairs for this structure, for load tests and
+        benchmarks. Records hold raw values, before any wrappers. Lengths, array counts and switch
+        decisions stay consistent with the fields they come from; variable lengths are kept to at
+        most max_length. The same seed always produces the same records.
+        """
+
+        rng = random.Random(seed)
+
+        for i in range(n):
+            record: dict = self.__generate_record(rng, {}, max_length)
+            yield record, self.to_bytes(record)
+
+    def generate_to_stream(
+        self, stream, n: int, seed=None, max_length: int = 16, batch_size: int = 4096
+    ) -> int:
+        """
+        Writes n random, valid records to a stream, encoding them batch_size at a time into one
+        buffer, so a large synthetic file takes few writes. Returns the number of bytes written.
+        """
+
+        rng = random.Random(seed)
+        written: int = 0
+
+        for start in range(0, n, batch_size):
+            batch = BytesIO()
+
+            for i in range(min(batch_size, n - start)):
+                self.to_stream(self.__generate_record(rng, {}, max_length), batch)
+
+            written += stream.write(batch.getbuffer())
+
+        return written
 
     def set_buffer_size(self, size: int):
         """
@@ -537,15 +1578,184 @@ class Structure:
 
         self.__buffer_size = size
 
+    def find_fields(self, name: str, kind) -> list:
+        """
+        Finds the field objects of a given kind stored under a field name, looking through
+        arrays and switch cases, since those carry anonymous copies of the real field.
+        """
+
+        if name not in self.field_correspondence:
+            raise cstruct2_non_existent_field_exception(name)
+
+        found = []
+        pending = [self.field_correspondence[name]]
+
+        while pending:
+            field = pending.pop()
+
+            if isinstance(field, list):
+                pending.append(field[2])
+
+            elif isinstance(field, switch_type):
+                pending.extend(field.decisions.values())
+
+            elif isinstance(field, kind):
+                found.append(field)
+
+        if not found:
+            raise cstruct2_field_exception(
+                f"The field {name} has no {getattr(kind, '__name__', 'field')} to configure."
+            )
+
+        return found
+
+    def set_interning(
+        self,
+        name: str,
+        table: InternTable | None = None,
+        maxsize: int = 4096,
+        strip_padding: bool | None = None,
+    ):
+        """
+        Turns on string interning for a str field: repeated raw values skip decoding and share a single
+        str object. Pass in a table to share it between fields, otherwise one of maxsize entries is made.
+        If strip_padding is given, it turns dropping the trailing null bytes of fixed width strings
+        on or off, like set_padding_stripping(); otherwise that is left as it is.
+        """
+
+        if table is None:
+            table = InternTable(maxsize)
+
+        for field in self.find_fields(name, cstruct2_string_field):
+            field.intern_table = table
+
+            if strip_padding is not None:
+                field.strip_padding = strip_padding
+
+        return table
+
+    def set_lazy(self, name: str, lazy: bool = True):
+        """
+        Makes a bytes or (non null-terminated) str field lazy: when read from a seekable stream, its payload
+        is skipped over and a BlobHandle pointing at it is returned instead. The handle can read, slice,
+        mmap or sendfile the payload later on. Non-seekable streams are still read normally. Structures
+        nesting this one only pick this up if it is called before they are declared.
+        """
+
+        fields = self.find_fields(name, (cstruct2_bytes_field, cstruct2_string_field))
+
+        for field in fields:
+            if isinstance(field, cstruct2_string_field) and field.width == "null":
+                raise cstruct2_field_exception(
+                    f"The field {name} is a null-terminated string, which cannot be skipped lazily."
+                )
+
+        for field in fields:
+            field.lazy = lazy
+
+        # Lazy fields can't be part of a flat plan.
+        self.__compile_flat_plan()
+
+    def set_padding_stripping(self, name: str, strip_padding: bool = True):
+        """Drop (or keep) the trailing null bytes of a fixed width str field when reading it."""
+
+        for field in self.find_fields(name, cstruct2_string_field):
+            field.strip_padding = strip_padding
+
+    def __fixed_width(self, field) -> int | None:
+        """The width of a field, or None if it can vary. Internal function: do not use."""
+
+        if isinstance(field, list):
+            element: int | None = self.__fixed_width(field[2])
+
+            if element is None or not isinstance(field[1], int):
+                return None
+
+            return field[1] * element
+
+        if isinstance(field, cstruct2_recursive_wrapper):
+            try:
+                return len(field.another)
+            except (cstruct2_indeterminate_length_exception, AttributeError, TypeError):
+                return None
+
+        if isinstance(field, (switch_type, cstruct2_bits_field)):
+            return None
+
+        if isinstance(field, cstruct2_string_field) and field.null:
+            return None
+
+        width = getattr(field, "width", None)
+        return width if isinstance(width, int) else None
+
+    def set_sync_marker(self, name: str, value: int | bytes):
+        """
+        Marks an int or bytes field as always holding a constant value (a magic number), which resync()
+        looks for to find where records start in a corrupt stream. Every field before it must have a
+        fixed width, so that the marker is always at the same offset into a record.
+        """
+
+        if name not in self.field_correspondence:
+            raise cstruct2_non_existent_field_exception(name)
+
+        offset: int = 0
+
+        for field_name, field in zip(self.field_names, self.fields):
+            if field_name == name:
+                break
+
+            width: int | None = self.__fixed_width(field)
+            if width is None:
+                raise cstruct2_field_exception(
+                    f"The sync marker {name} must be at a fixed offset, but {field_name} comes before it "
+                    "and varies in width."
+                )
+
+            offset += width
+
+        field = self.field_correspondence[name]
+
+        if isinstance(field, cstruct2_int_field) and isinstance(field.width, int):
+            marker: bytes = value.to_bytes(
+                field.width, field.endianness, signed=value < 0
+            )
+
+        elif isinstance(field, cstruct2_bytes_field) and isinstance(field.width, int):
+            if len(value) != field.width:
+                raise cstruct2_too_big_exception(name, field.width, len(value))
+
+            marker = bytes(value)
+
+        else:
+            raise cstruct2_field_exception(
+                f"The sync marker {name} must be a fixed width int or bytes field."
+            )
+
+        self.sync_marker = (offset, marker)
+
     def __len__(self) -> int:
         if self.has_derived_length:
             raise cstruct2_indeterminate_length_exception()
 
+        if self.flat_plan is not None:
+            return self.flat_plan.size
+
         result = 0
 
         # Switch cases are not supported because they are, by definition, indeterminate at
         # structure initialization time.
         for field in self.fields:
+            if isinstance(field, list):
+                element = field[2]
+                width = (
+                    len(element.another)
+                    if isinstance(element, cstruct2_recursive_wrapper)
+                    else element.width
+                )
+
+                result += field[1] * width
+                continue
+
             if isinstance(field, cstruct2_recursive_wrapper):
                 result += len(field.another)
                 continue
@@ -557,5 +1767,7 @@ class Structure:
         # Likewise, if we read 12 bits, we've definitely read a byte (8 bits) but then read an extra 4 bits,
         # which is another byte!
 
+        return result
+
 
 structure = Structure
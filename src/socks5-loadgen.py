@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import resource
+import socket
+import sys
+import time
+
+from cstruct2.decorator import Structure
+
+# Drives a SOCKS5 proxy (like socks5-server.py) with many concurrent loopback connections, all
+# going through it to a local echo server started by this program, and reports how many handshakes
+# per second the proxy completes and how fast it relays.
+
+
+@Structure
+class ClientHandshake:
+    version: int = 1
+    methods_length: int = 1
+    methods: int = ["methods_length", 1]
+
+
+@Structure
+class ServerHandshakeResponse:
+    version: int = 1
+    method: int = 1
+
+
+@Structure
+class ClientRequest:
+    version: int = 1
+    command: int = 1
+    reserved: int = 1
+    address_type: int = 1
+    address: bytes = 4
+    port: int = ("big", 2)
+
+
+@Structure
+class ServerResponse:
+    version: int = 1
+    reply: int = 1
+    reserved: int = 1
+    address_type: int = 1
+    address: bytes = 4
+    port: int = ("big", 2)
+
+
+class Stats:
+    def __init__(self):
+        self.handshakes: int = 0
+        self.failures: int = 0
+        self.bytes_relayed: int = 0
+        self.handshake_time: float = 0.0
+
+
+# The echo server's connection handlers, so they can be shut down before the event loop goes away.
+echo_tasks: set = set()
+
+
+async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    echo_tasks.add(asyncio.current_task())
+
+    try:
+        while data := await reader.read(1 << 16):
+            writer.write(data)
+            await writer.drain()
+
+    # Being cancelled at shutdown is a normal way for a handler to end.
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+
+    finally:
+        writer.close()
+        echo_tasks.discard(asyncio.current_task())
+
+
+async def client(
+    proxy: tuple[str, int],
+    target_port: int,
+    payload: bytes,
+    rounds: int,
+    stats: Stats,
+    start_line: asyncio.Event,
+):
+    await start_line.wait()
+
+    try:
+        started: float = time.perf_counter()
+        reader, writer = await asyncio.open_connection(*proxy)
+
+        writer.write(
+            ClientHandshake.to_bytes(
+                {"version": 5, "methods_length": 1, "methods": [0]}
+            )
+        )
+        ServerHandshakeResponse.from_bytes(await reader.readexactly(2))
+
+        writer.write(
+            ClientRequest.to_bytes(
+                {
+                    "version": 5,
+                    "command": 1,
+                    "reserved": 0,
+                    "address_type": 1,
+                    "address": socket.inet_aton("127.0.0.1"),
+                    "port": target_port,
+                }
+            )
+        )
+        response: dict = ServerResponse.from_bytes(await reader.readexactly(10))
+
+        if response["reply"] != 0:
+            stats.failures += 1
+            writer.close()
+            return
+
+        stats.handshakes += 1
+        stats.handshake_time += time.perf_counter() - started
+
+        # Send the payload, and read it back as it comes (writing it all first could deadlock once
+        # every buffer along the way is full).
+        for i in range(rounds):
+            writer.write(payload)
+            received: int = 0
+
+            while received < len(payload):
+                data: bytes = await reader.read(1 << 16)
+                if not data:
+                    raise ConnectionError("The proxy closed the connection early.")
+
+                received += len(data)
+
+                if writer.transport.get_write_buffer_size() > 0:
+                    await writer.drain()
+
+            stats.bytes_relayed += 2 * len(payload)
+
+        writer.close()
+        await writer.wait_closed()
+
+    except (ConnectionError, OSError, asyncio.IncompleteReadError) as err:
+        stats.failures += 1
+        if stats.failures <= 5:
+            print(f"Connection failed: {err!r}", file=sys.stderr)
+
+
+async def run(args):
+    target = await asyncio.start_server(echo, "127.0.0.1", 0, backlog=4096)
+    target_port: int = target.sockets[0].getsockname()[1]
+
+    stats = Stats()
+    payload: bytes = bytes(args.payload)
+    proxy: tuple[str, int] = (args.host, args.port)
+
+    # Limits how many connections are open at once; the rest queue up behind them.
+    limit = asyncio.Semaphore(args.concurrency)
+    start_line = asyncio.Event()
+
+    async def limited():
+        async with limit:
+            await client(proxy, target_port, payload, args.rounds, stats, start_line)
+
+    tasks = [asyncio.create_task(limited()) for i in range(args.connections)]
+
+    started: float = time.perf_counter()
+    start_line.set()
+    await asyncio.gather(*tasks)
+    elapsed: float = time.perf_counter() - started
+
+    target.close()
+
+    # Handlers whose proxy side never closed are still waiting on a read.
+    for task in list(echo_tasks):
+        task.cancel()
+
+    await asyncio.gather(*echo_tasks, return_exceptions=True)
+    await target.wait_closed()
+
+    print(f"connections:    {args.connections} ({args.concurrency} at once)")
+    print(f"failures:       {stats.failures}")
+    print(f"elapsed:        {elapsed:.2f} s")
+    print(f"handshakes/sec: {stats.handshakes / elapsed:.0f}")
+
+    if stats.handshakes:
+        print(
+            f"mean handshake: {1000 * stats.handshake_time / stats.handshakes:.2f} ms"
+        )
+
+    print(f"relayed:        {stats.bytes_relayed / (1 << 20):.1f} MiB")
+    print(f"throughput:     {stats.bytes_relayed / (1 << 20) / elapsed:.1f} MiB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for socks5-server.py.")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the proxy")
+    parser.add_argument(
+        "-p", "--port", type=int, default=8080, help="port of the proxy"
+    )
+    parser.add_argument("-n", "--connections", type=int, default=5000)
+    parser.add_argument("-c", "--concurrency", type=int, default=1000)
+    parser.add_argument(
+        "--payload",
+        type=int,
+        default=1 << 16,
+        help="bytes echoed through the proxy per round",
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=1, help="echo rounds per connection"
+    )
+
+    args = parser.parse_args()
+
+    # Every connection needs three descriptors here (ours, and the echo server's), so make room.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted: int = min(hard, max(soft, 4 * args.concurrency + 64))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
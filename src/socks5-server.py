@@ -1,11 +1,22 @@
+import argparse
+import errno
+import os
+import selectors
 import socket
-import select
 import sys
-import threading
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum
 from cstruct2.decorator import Structure, switch, structure
-from cstruct2.cstruct2_utils import SocketWrapper
+from cstruct2.cstruct2_utils import CachedWrapper, DeferredValue, DeferredWrapper
+
+# Domain lookups are slow and blocking, so they are handed off to a small pool while the event loop
+# keeps serving everyone else, and their results are reused across connections for 5 minutes.
+resolver_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="resolver")
+gethostbyname = DeferredWrapper(
+    CachedWrapper(socket.gethostbyname, maxsize=4096, ttl=300), resolver_pool
+)
 
 
 @Structure
@@ -32,6 +43,19 @@ class AddressTypes(IntEnum):
     IPv6 = 4
 
 
+class Commands(IntEnum):
+    Connect = 1
+
+
+class Replies(IntEnum):
+    Succeeded = 0
+    GeneralFailure = 1
+    HostUnreachable = 4
+    ConnectionRefused = 5
+    CommandNotSupported = 7
+    AddressTypeNotSupported = 8
+
+
 @Structure
 class ClientRequest:
     version: int = 1
@@ -42,7 +66,12 @@ class ClientRequest:
         "address_type",
         {
             AddressTypes.IPv4: (bytes, 4, socket.inet_ntoa),
-            AddressTypes.Domain: (str, "pascal", "ascii", socket.gethostbyname),
+            AddressTypes.Domain: (str, "pascal", "ascii", gethostbyname),
+            AddressTypes.IPv6: (
+                bytes,
+                16,
+                lambda address: socket.inet_ntop(socket.AF_INET6, address),
+            ),
         },
     )
     port: int = ("big", 2)
@@ -58,83 +87,575 @@ class ServerResponse:
     port: int = ("big", 2)
 
 
-def handler(client: socket.socket):
-    sclient: SocketWrapper = SocketWrapper(client, rw_all=True)
-    handshake: dict = ClientHandshake.from_stream(sclient)
+def handshake_length(data: bytearray) -> int | None:
+    """How long the client's handshake is, or None if we don't have enough of it to tell yet."""
 
-    ServerHandshakeResponse.to_stream(
-        {"version": 5, "method": AuthenticationMethods.NoAuthentication}, sclient
-    )
+    if len(data) < 2:
+        return None
 
-    request: dict = ClientRequest.from_stream(sclient)
+    return 2 + data[1]
 
-    ServerResponse.to_stream(
-        {
-            "version": 5,
-            "reply": 0,
-            "reserved": 0,
-            "address_type": AddressTypes.IPv4,
-            "address": socket.inet_aton(request["address"]),
-            "port": 443,
-        },
-        sclient,
-    )
 
-    other_sock: socket.socket = socket.socket(
-        socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP
-    )
-    other_sock.connect((request["address"], request["port"]))
+def request_length(data: bytearray) -> int | None:
+    """How long the client's request is, or None if we don't have enough of it to tell yet."""
+
+    if len(data) < 5:
+        return None
+
+    address_type: int = data[3]
+
+    if address_type == AddressTypes.IPv4:
+        return 4 + 4 + 2
+
+    if address_type == AddressTypes.Domain:
+        return 4 + 1 + data[4] + 2
+
+    if address_type == AddressTypes.IPv6:
+        return 4 + 16 + 2
+
+    # Unknown address type: let the decoder fail on it.
+    return 4
+
+
+class Relay:
+    """
+    Moves bytes in one direction, from src to dst. With splice, bytes go from one socket into a pipe
+    and from the pipe into the other socket without ever being copied into Python. Otherwise, one large
+    buffer is reused. Either way, at most one buffer's worth is in flight: while it can't be written out,
+    src isn't read from, which is what pushes backpressure back onto the sender.
+    """
+
+    def __init__(
+        self, src: socket.socket, dst: socket.socket, buffer_size: int, use_splice: bool
+    ):
+        self.src = src
+        self.dst = dst
+        self.buffer_size = buffer_size
+
+        self.pending: int = 0
+        self.eof: bool = False
+        self.closed: bool = False
+        self.transferred: int = 0
+
+        self.pipe: tuple[int, int] | None = None
+        if use_splice:
+            self.pipe = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+
+            # A bigger pipe means fewer trips around the event loop per megabyte.
+            try:
+                import fcntl
+
+                fcntl.fcntl(self.pipe[1], fcntl.F_SETPIPE_SZ, buffer_size)
+            except (ImportError, AttributeError, OSError):
+                pass
+
+        else:
+            self.buffer = memoryview(bytearray(buffer_size))
+            self.start: int = 0
+
+    @property
+    def wants_read(self) -> bool:
+        return not self.eof and self.pending == 0
+
+    @property
+    def wants_write(self) -> bool:
+        return self.pending > 0
+
+    def fill(self):
+        """Reads as much as one buffer from src. Returns when src has nothing more for us."""
+
+        if self.pending or self.eof:
+            return
+
+        try:
+            if self.pipe is not None:
+                read: int = os.splice(
+                    self.src.fileno(),
+                    self.pipe[1],
+                    self.buffer_size,
+                    flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK,
+                )
+            else:
+                read = self.src.recv_into(self.buffer)
+                self.start = 0
+
+        except (BlockingIOError, InterruptedError):
+            return
+
+        if read == 0:
+            self.eof = True
+        else:
+            self.pending = read
+
+    def drain(self):
+        """Writes out whatever is pending, as far as dst will take it."""
 
-    while True:
-        readfds, writefds, excfds = select.select([other_sock, client], [], [])
+        while self.pending:
+            try:
+                if self.pipe is not None:
+                    written: int = os.splice(
+                        self.pipe[0],
+                        self.dst.fileno(),
+                        self.pending,
+                        flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK,
+                    )
+                else:
+                    written = self.dst.send(
+                        self.buffer[self.start : self.start + self.pending]
+                    )
+                    self.start += written
+
+            except (BlockingIOError, InterruptedError):
+                return
+
+            self.pending -= written
+            self.transferred += written
+
+        # Everything src will ever send has been forwarded: pass the EOF on.
+        if self.eof and not self.closed:
+            self.closed = True
+
+            try:
+                self.dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    def close(self):
+        if self.pipe is not None:
+            os.close(self.pipe[0])
+            os.close(self.pipe[1])
+            self.pipe = None
+
+
+class Connection:
+    """One client, from the SOCKS5 handshake to the end of relaying its traffic."""
+
+    HANDSHAKE, REQUEST, RESOLVING, CONNECTING, RELAY, CLOSED = range(6)
+
+    def __init__(self, server: "Server", client: socket.socket):
+        self.server = server
+        self.client = client
+        self.upstream: socket.socket | None = None
+
+        self.state = Connection.HANDSHAKE
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+
+        self.relays: list[Relay] = []
+        self.masks: dict[socket.socket, int] = {}
+        self.address: tuple[str, int] | None = None
+
+    # Event loop plumbing
+
+    def watch(self, sock: socket.socket, mask: int):
+        current: int = self.masks.get(sock, 0)
+        if mask == current:
+            return
+
+        selector = self.server.selector
+
+        if mask == 0:
+            selector.unregister(sock)
+        elif current == 0:
+            selector.register(sock, mask, self)
+        else:
+            selector.modify(sock, mask, self)
+
+        self.masks[sock] = mask
+
+    def update_interest(self):
+        """Works out which events we need on both sockets, based on the state and the relays."""
+
+        if self.state == Connection.CLOSED:
+            return
+
+        client_mask: int = 0
+        upstream_mask: int = 0
+
+        if self.state in [Connection.HANDSHAKE, Connection.REQUEST]:
+            client_mask |= selectors.EVENT_READ
+
+        if self.outbuf:
+            client_mask |= selectors.EVENT_WRITE
+
+        if self.state == Connection.CONNECTING:
+            upstream_mask |= selectors.EVENT_WRITE
+
+        if self.state == Connection.RELAY and not self.outbuf:
+            to_upstream, to_client = self.relays
+
+            if to_upstream.wants_read:
+                client_mask |= selectors.EVENT_READ
+            if to_upstream.wants_write:
+                upstream_mask |= selectors.EVENT_WRITE
+            if to_client.wants_read:
+                upstream_mask |= selectors.EVENT_READ
+            if to_client.wants_write:
+                client_mask |= selectors.EVENT_WRITE
+
+        self.watch(self.client, client_mask)
+        if self.upstream is not None:
+            self.watch(self.upstream, upstream_mask)
+
+    def on_event(self, sock: socket.socket, mask: int):
         try:
-            for sock in readfds:
-                if sock == client:
-                    try:
-                        while True:
-                            data: bytes = client.recv(4096, socket.MSG_DONTWAIT)
-                            other_sock.send(data)
-                    except socket.error as e:
-                        if e.errno == socket.EWOULDBLOCK:
-                            ...
-                        else:
-                            raise e
-
-                if sock == other_sock:
-                    try:
-                        while True:
-                            data: bytes = other_sock.recv(4096, socket.MSG_DONTWAIT)
-                            client.send(data)
-                    except socket.error as e:
-                        if e.errno == socket.EWOULDBLOCK:
-                            continue
-
-                        raise e
+            if sock is self.client:
+                if mask & selectors.EVENT_WRITE:
+                    self.on_client_writable()
+                if mask & selectors.EVENT_READ and self.state != Connection.CLOSED:
+                    self.on_client_readable()
+
+            else:
+                if mask & selectors.EVENT_WRITE:
+                    self.on_upstream_writable()
+                if mask & selectors.EVENT_READ and self.state != Connection.CLOSED:
+                    self.on_upstream_readable()
+
+        except (ConnectionError, OSError) as err:
+            # Resets and the like are business as usual for a proxy.
+            if not isinstance(err, ConnectionError) and err.errno not in [
+                errno.EPIPE,
+                errno.ECONNRESET,
+                errno.ENOTCONN,
+            ]:
+                print(f"Connection error: {err}", file=sys.stderr)
+
+            self.close()
+
         except Exception as err:
-            print(str(err))
+            print(f"Dropping client: {err!r}", file=sys.stderr)
+            self.close()
+
+        self.update_interest()
+
+    # Handshake and request
+
+    def on_client_readable(self):
+        if self.state == Connection.RELAY:
+            to_upstream: Relay = self.relays[0]
+            to_upstream.fill()
+            to_upstream.drain()
+            self.check_finished()
             return
 
+        data: bytes = self.client.recv(512)
+        if not data:
+            self.close()
+            return
 
-def main():
-    port = 8080
-    if sys.argv[1] in ["-p", "--port"]:
-        port = int(sys.argv[2])
-    else:
-        print("Warning: no port explicitly passed in, using the default port of 8080.")
+        self.inbuf += data
+
+        if self.state == Connection.HANDSHAKE:
+            length: int | None = handshake_length(self.inbuf)
+            if length is None or len(self.inbuf) < length:
+                return
+
+            ClientHandshake.from_bytes(bytes(self.inbuf[:length]))
+            del self.inbuf[:length]
+
+            self.send(
+                ServerHandshakeResponse.to_bytes(
+                    {"version": 5, "method": AuthenticationMethods.NoAuthentication}
+                )
+            )
+
+            self.state = Connection.REQUEST
+
+        if self.state == Connection.REQUEST:
+            length = request_length(self.inbuf)
+            if length is None or len(self.inbuf) < length:
+                return
+
+            try:
+                request: dict = ClientRequest.from_bytes(bytes(self.inbuf[:length]))
+            except KeyError:
+                self.fail(Replies.AddressTypeNotSupported)
+                return
+
+            del self.inbuf[:length]
+
+            if request["command"] != Commands.Connect:
+                self.fail(Replies.CommandNotSupported)
+                return
+
+            address = request["address"]
+            port: int = request["port"]
+
+            # Domains are resolved in the background; the loop is woken up when they are done.
+            if isinstance(address, DeferredValue):
+                self.state = Connection.RESOLVING
+                address.future.add_done_callback(
+                    lambda future: self.server.call_soon(self.on_resolved, future, port)
+                )
+                return
+
+            self.connect(address, port)
+
+    def on_resolved(self, future, port: int):
+        if self.state != Connection.RESOLVING:
+            return
+
+        try:
+            address: str = future.result()
+        except OSError:
+            self.fail(Replies.HostUnreachable)
+        else:
+            self.connect(address, port)
+
+        self.update_interest()
+
+    def connect(self, address: str, port: int):
+        family = socket.AF_INET6 if ":" in address else socket.AF_INET
+
+        self.upstream = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        self.upstream.setblocking(False)
+        self.upstream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.address = (address, port)
+        self.state = Connection.CONNECTING
+
+        result: int = self.upstream.connect_ex((address, port))
+        if result not in [0, errno.EINPROGRESS]:
+            self.fail(Replies.ConnectionRefused)
+
+    def on_upstream_writable(self):
+        if self.state == Connection.CONNECTING:
+            error: int = self.upstream.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self.fail(
+                    Replies.ConnectionRefused
+                    if error == errno.ECONNREFUSED
+                    else Replies.HostUnreachable
+                )
+                return
+
+            bound = self.upstream.getsockname()
+            bound_address: bytes = (
+                socket.inet_aton(bound[0])
+                if self.upstream.family == socket.AF_INET
+                else bytes(4)
+            )
+
+            self.send(
+                ServerResponse.to_bytes(
+                    {
+                        "version": 5,
+                        "reply": Replies.Succeeded,
+                        "reserved": 0,
+                        "address_type": AddressTypes.IPv4,
+                        "address": bound_address,
+                        "port": bound[1],
+                    }
+                )
+            )
+
+            self.start_relay()
+            return
+
+        to_upstream: Relay = self.relays[0]
+        to_upstream.drain()
+        self.check_finished()
+
+    def on_upstream_readable(self):
+        to_client: Relay = self.relays[1]
+        to_client.fill()
+        to_client.drain()
+        self.check_finished()
+
+    def on_client_writable(self):
+        if self.outbuf:
+            sent: int = self.client.send(self.outbuf)
+            del self.outbuf[:sent]
+
+            if not self.outbuf and self.state == Connection.CLOSED:
+                self.close()
+
+            # Anything the client pipelined right after its request is relayed once the reply is out.
+            if not self.outbuf and self.state == Connection.RELAY and self.inbuf:
+                self.upstream.sendall(self.inbuf)
+                self.inbuf.clear()
+
+            return
+
+        if self.state == Connection.RELAY:
+            to_client: Relay = self.relays[1]
+            to_client.drain()
+            self.check_finished()
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Relaying
 
-    sock.bind(("0.0.0.0", port))
-    sock.listen(64)
+    def start_relay(self):
+        self.state = Connection.RELAY
+        self.relays = [
+            Relay(
+                self.client,
+                self.upstream,
+                self.server.buffer_size,
+                self.server.use_splice,
+            ),
+            Relay(
+                self.upstream,
+                self.client,
+                self.server.buffer_size,
+                self.server.use_splice,
+            ),
+        ]
 
-    print(f"Hosting SOCKS5 proxy server on port {port}")
+    def check_finished(self):
+        if all(relay.closed for relay in self.relays):
+            self.server.bytes_relayed += sum(relay.transferred for relay in self.relays)
+            self.close()
+
+    # Teardown
+
+    def send(self, data: bytes):
+        self.outbuf += data
+
+    def fail(self, reply: Replies):
+        """Tells the client its request failed, then closes the connection once that's sent."""
+
+        self.send(
+            ServerResponse.to_bytes(
+                {
+                    "version": 5,
+                    "reply": reply,
+                    "reserved": 0,
+                    "address_type": AddressTypes.IPv4,
+                    "address": bytes(4),
+                    "port": 0,
+                }
+            )
+        )
+
+        if self.upstream is not None:
+            self.watch(self.upstream, 0)
+            self.upstream.close()
+            self.upstream = None
+
+        self.state = Connection.CLOSED
+        self.watch(self.client, selectors.EVENT_WRITE)
+
+    def close(self):
+        for sock in [self.client, self.upstream]:
+            if sock is not None:
+                self.watch(sock, 0)
+                sock.close()
+
+        for relay in self.relays:
+            relay.close()
+
+        self.relays = []
+        self.outbuf.clear()
+        self.upstream = None
+        self.state = Connection.CLOSED
+        self.server.connections.discard(self)
+
+
+class Server:
+    """A single-threaded SOCKS5 (CONNECT only, no authentication) proxy, built on selectors."""
+
+    def __init__(self, host: str, port: int, buffer_size: int, use_splice: bool):
+        self.selector = selectors.DefaultSelector()
+        self.buffer_size = buffer_size
+        self.use_splice = use_splice and hasattr(os, "splice")
+
+        self.connections: set[Connection] = set()
+        self.bytes_relayed: int = 0
+
+        self.sock = socket.socket(
+            socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP
+        )
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(socket.SOMAXCONN)
+        self.sock.setblocking(False)
+        self.selector.register(self.sock, selectors.EVENT_READ, None)
+
+        # Other threads (the resolver pool) hand work back to the loop through this queue, and
+        # wake it up by writing to the socket pair.
+        self.callbacks: deque = deque()
+        self.waker, self.wakee = socket.socketpair()
+        self.waker.setblocking(False)
+        self.wakee.setblocking(False)
+        self.selector.register(self.wakee, selectors.EVENT_READ, self.callbacks)
+
+    def call_soon(self, callback, *args):
+        """Schedules a callback on the event loop. Safe to call from any thread."""
+
+        self.callbacks.append((callback, args))
+
+        try:
+            self.waker.send(b"\0")
+        except BlockingIOError:
+            # Already plenty of wakeups pending.
+            pass
+
+    def accept(self):
+        while True:
+            try:
+                client, address = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            connection = Connection(self, client)
+            self.connections.add(connection)
+            connection.update_interest()
+
+    def run_callbacks(self):
+        try:
+            while self.wakee.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while self.callbacks:
+            callback, args = self.callbacks.popleft()
+            callback(*args)
+
+    def serve_forever(self):
+        while True:
+            for key, mask in self.selector.select():
+                if key.data is None:
+                    self.accept()
+                elif key.data is self.callbacks:
+                    self.run_callbacks()
+                else:
+                    key.data.on_event(key.fileobj, mask)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="A SOCKS5 proxy server, using cstruct2 for parsing."
+    )
+    parser.add_argument("-p", "--port", type=int, default=8080)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument(
+        "--buffer-size",
+        type=int,
+        default=1 << 18,
+        help="bytes relayed per direction at a time (and pipe size, with splice)",
+    )
+    parser.add_argument(
+        "--no-splice",
+        action="store_true",
+        help="relay through recv_into/send instead of splice",
+    )
+
+    args = parser.parse_args()
+
+    server = Server(args.host, args.port, args.buffer_size, not args.no_splice)
+    print(
+        f"Hosting SOCKS5 proxy server on port {args.port} "
+        f"({'splice' if server.use_splice else 'recv_into'} relay)"
+    )
 
-    while True:
-        client, address = sock.accept()
-        print(f"Connection received from: {address[0]}:{address[1]}")
-        thr = threading.Thread(target=handler, args=(client,))
-        thr.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":